@@ -9,6 +9,7 @@ from aria.ops.data import Property
 from aria.ops.object import Identifier
 from aria.ops.object import Key
 
+from linker import ObjectIndex
 from restcall import RestClient
 
 logger = logging.getLogger(__name__)
@@ -26,30 +27,17 @@ class RDSFarm(Object):
             )
         )
 
-def get_rds_farms(host, port, token, page) -> List[RDSFarm]:
+def get_rds_farms(client: RestClient, index: ObjectIndex) -> List[RDSFarm]:
         RDSFarms = []
-        size = 1000
-        base_url = "https://" + str(host) + ":" + str(port)
-        headers = {
-            'Authorization': 'Bearer ' + token,
-        }
-        client = RestClient(base_url)
-        # Make a GET request to the device endpoint
-        queryString = '/rest/inventory/v4/farms?size=' + str(size) + '&page=' + str(page)
-        status_code, response_data = client.get(queryString, headers)
-        if status_code == 200:
-            for obj in response_data:
-                logger.info("Farm ID:" + obj["id"])
-                logger.info("Farm Name:" + obj["name"])
-                # creating object and adding it to the result set
-                new_farm = RDSFarm(obj["name"], obj["id"])
-                new_farm.with_property("id", obj["id"])
-                new_farm.with_metric("enabled", obj["enabled"])
-                new_farm.with_property("type", obj["type"])
-                RDSFarms.append(new_farm)
-            if len(response_data) == size:
-                get_rds_farms(host, port, token, page +1)
-        else:
-            logger.error("Error:", status_code)
+        for obj in client.paginate('/rest/inventory/v4/farms'):
+            logger.info("Farm ID:" + obj["id"])
+            logger.info("Farm Name:" + obj["name"])
+            # creating object and adding it to the result set
+            new_farm = RDSFarm(obj["name"], obj["id"])
+            new_farm.with_property("id", obj["id"])
+            new_farm.with_metric("enabled", obj["enabled"])
+            new_farm.with_property("type", obj["type"])
+            index.register(new_farm)
+            RDSFarms.append(new_farm)
 
         return RDSFarms
\ No newline at end of file
@@ -1,8 +1,13 @@
 #  Copyright 2022 VMware, Inc.
 #  SPDX-License-Identifier: Apache-2.0
 import json
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
 from typing import List
+from typing import Optional
 import requests
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -27,12 +32,42 @@ from constants import USER_CREDENTIAL
 from constants import PASSWORD_CREDENTIAL
 from constants import DOMAIN_CREDENTIAL
 from restcall import RestClient
+from rateLimiter import AdaptiveRateLimiter
+from serverPool import ServerPool
+from serverPool import ROUND_ROBIN
+from serverPool import LEAST_LATENCY
+from tokenManager import AuthenticationError
+from tokenManager import TokenManager
+from linker import ObjectIndex
+from scheduler import CollectionScheduler
+from cache import PersistentCache
+from selfMonitoring import RequestStats
+from memoryGovernor import MemoryGovernor
+from snapshot import InventorySnapshots
+from capacityProbe import CapacityProbe
+from capacityProbe import ProbeError
+from capacityProbe import estimate
+from profiler import Profiler
+from profiler import MODES as PROFILING_MODES
+from profiler import OFF as PROFILING_OFF
+from profiler import log_directory
+from profiler import rotate
+from trafficArchive import TrafficRecorder
+from tracer import Tracer
+from tracer import FORMATS as TRACING_FORMATS
+from tracer import OFF as TRACING_OFF
+from tracer import CHROME as TRACING_CHROME
+from tracer import NULL_TRACER
+import daemon
+from daemon import SnapshotResult
+from selfMonitoring import get_adapter_health
 #from collectDevices import
 from localSite import get_local_site
 from localPod import get_local_pod
 from globalDesktopPools import get_global_desktop_pools
 from localDesktopPools import get_local_desktop_pools
 from localSessions import get_local_sessions
+from localSessions import get_logon_timings
 from RDSFarms import get_rds_farms
 from RDSHosts import get_rds_hosts
 from localApplicationPools import get_local_application_pools
@@ -68,6 +103,15 @@ def get_adapter_definition() -> AdapterDefinition:
             default="",
         )
 
+        definition.define_string_parameter(
+            constants.ADDITIONAL_HOSTS_IDENTIFIER,
+            label="Additional Pods",
+            description="Comma separated FQDNs or IPs of one connection server in each other pod "
+            "to collect with this adapter instance",
+            required=False,
+            default="",
+        )
+
         definition.define_int_parameter(
             constants.PORT_IDENTIFIER,
             label="TCP Port",
@@ -77,6 +121,138 @@ def get_adapter_definition() -> AdapterDefinition:
             default=443,
         )
         
+        definition.define_string_parameter(
+            constants.CONNECTION_SERVERS_IDENTIFIER,
+            label="Connection Servers",
+            description="Further connection servers of a pod that read requests are spread across, "
+            "as host=server1|server2 entries separated by commas, where host is the Host or one of the Additional Pods",
+            required=False,
+            advanced=True,
+            default="",
+        )
+
+        definition.define_enum_parameter(
+            constants.LOAD_BALANCING_IDENTIFIER,
+            values=[ROUND_ROBIN, LEAST_LATENCY],
+            label="Load Balancing",
+            description="How read requests are spread across the connection servers of a pod",
+            default=ROUND_ROBIN,
+            required=False,
+            advanced=True,
+        )
+
+        definition.define_int_parameter(
+            constants.MAX_CONCURRENT_REQUESTS_IDENTIFIER,
+            label="Max Concurrent Requests",
+            description="Maximum number of requests in flight to each connection server. "
+            "Lowered automatically while the server is slow or answers 429/503.",
+            required=False,
+            advanced=True,
+            default=constants.DEFAULT_MAX_CONCURRENT_REQUESTS,
+        )
+
+        definition.define_int_parameter(
+            constants.MAX_REQUESTS_PER_SECOND_IDENTIFIER,
+            label="Max Requests per Second",
+            description="Maximum number of requests per second sent to each connection server, 0 for no limit",
+            required=False,
+            advanced=True,
+            default=constants.DEFAULT_MAX_REQUESTS_PER_SECOND,
+        )
+
+        definition.define_int_parameter(
+            constants.TARGET_LATENCY_IDENTIFIER,
+            label="Target Latency (ms)",
+            description="Response time above which the number of concurrent requests is reduced",
+            required=False,
+            advanced=True,
+            default=constants.DEFAULT_TARGET_LATENCY,
+        )
+
+        definition.define_int_parameter(
+            constants.MAX_RETRIES_IDENTIFIER,
+            label="Max Retries",
+            description="Retries of a failed GET request, with a growing random delay between attempts",
+            required=False,
+            advanced=True,
+            default=constants.DEFAULT_MAX_RETRIES,
+        )
+
+        definition.define_int_parameter(
+            constants.REQUEST_TIMEOUT_IDENTIFIER,
+            label="Request Timeout (s)",
+            description="Seconds to wait for the answer to a request before it is retried, "
+            "timeouts count as failures of the endpoint family's circuit breaker",
+            required=False,
+            advanced=True,
+            default=constants.DEFAULT_REQUEST_TIMEOUT,
+        )
+
+        definition.define_int_parameter(
+            constants.INVENTORY_REFRESH_IDENTIFIER,
+            label="Inventory Refresh Interval (min)",
+            description="Sites, pods, entitlements, pools and farms are refetched at this interval "
+            "and loaded from a local snapshot in between, 0 refetches them every collection",
+            required=False,
+            advanced=True,
+            default=constants.DEFAULT_INVENTORY_REFRESH,
+        )
+
+        definition.define_enum_parameter(
+            constants.STREAMING_DECODE_IDENTIFIER,
+            values=["true", "false"],
+            label="Streaming JSON Decode",
+            description="Decode inventory pages item by item while they are received, "
+            "lowers peak memory at the cost of prefetching the next page",
+            default="false",
+            required=False,
+            advanced=True,
+        )
+
+        definition.define_enum_parameter(
+            constants.DAEMON_MODE_IDENTIFIER,
+            values=["true", "false"],
+            label="Daemon Mode",
+            description="Collect in a long-lived background process that keeps connections and caches warm, "
+            "each collection returns its latest result",
+            default="false",
+            required=False,
+            advanced=True,
+        )
+
+        definition.define_enum_parameter(
+            constants.RECORD_TRAFFIC_IDENTIFIER,
+            values=["true", "false"],
+            label="Record Traffic",
+            description="Records the requests and responses of each collection, without credentials or tokens, "
+            "to a compressed archive next to adapter.log for offline replay",
+            default="false",
+            required=False,
+            advanced=True,
+        )
+
+        definition.define_enum_parameter(
+            constants.TRACING_IDENTIFIER,
+            values=TRACING_FORMATS,
+            label="Tracing",
+            description="Writes the spans of each collection (collectors, pages, HTTP requests) next to adapter.log "
+            "as Chrome trace events or OTLP JSON",
+            default=TRACING_OFF,
+            required=False,
+            advanced=True,
+        )
+
+        definition.define_enum_parameter(
+            constants.PROFILING_IDENTIFIER,
+            values=PROFILING_MODES,
+            label="Profiling",
+            description="Profiles CPU time (cProfile) and/or allocations (tracemalloc) of each test and "
+            "collection, the reports are written next to adapter.log",
+            default=PROFILING_OFF,
+            required=False,
+            advanced=True,
+        )
+
         credential = definition.define_credential_type("vdi_user", "Credential")
         credential.define_string_parameter(constants.USER_CREDENTIAL, "User Name") 
         credential.define_password_parameter(constants.PASSWORD_CREDENTIAL, "Password")
@@ -107,6 +283,8 @@ def get_adapter_definition() -> AdapterDefinition:
         localDesktopPool.define_string_property("global_pool_id", "Global pool")
         localDesktopPool.define_string_property("farm_id", "farm_id")
         localDesktopPool.define_metric("enabled", "enabled")
+        localDesktopPool.define_metric("sessions_started", "Sessions started")
+        localDesktopPool.define_metric("sessions_ended", "Sessions ended")
 
         globalApplicationPool = definition.define_object_type("globalApplicationPool", "Global application pool")
         globalApplicationPool.define_string_identifier("uuid", "UUID")
@@ -129,6 +307,8 @@ def get_adapter_definition() -> AdapterDefinition:
         RDSFarm.define_string_property("name", "name")
         RDSFarm.define_metric("enabled", "enabled")
         RDSFarm.define_string_property("type", "type")
+        RDSFarm.define_metric("sessions_started", "Sessions started")
+        RDSFarm.define_metric("sessions_ended", "Sessions ended")
 
         RDSHost = definition.define_object_type("RDSHost", "RDS Host")
         RDSHost.define_string_identifier("uuid", "UUID")
@@ -139,7 +319,7 @@ def get_adapter_definition() -> AdapterDefinition:
         RDSHost.define_metric("session_count","session_count")
         RDSHost.define_metric("max_session_count", "max_session_count")
         RDSHost.define_metric("max_session_count_configured", "max_session_count_configured")
-        RDSHost.define_metric("state", "state")
+        RDSHost.define_string_property("state", "state")
         
         localSession = definition.define_object_type("localSession", "Local session")
         localSession.define_string_identifier("uuid", "UUID")
@@ -147,113 +327,324 @@ def get_adapter_definition() -> AdapterDefinition:
         localSession.define_string_property("name", "name")
         localSession.define_metric("enabled", "enabled")
 
+        adapterHealth = definition.define_object_type("adapterInstanceHealth", "Adapter Instance Health")
+        adapterHealth.define_string_identifier("uuid", "UUID")
+        adapterHealth.define_metric("collection_duration", "Collection duration", Units.TIME.SECONDS)
+        adapterHealth.define_metric("object_count", "Objects collected")
+        for family in constants.ENDPOINT_FAMILIES:
+            endpoints = adapterHealth.define_group(family, family.capitalize() + " endpoints")
+            endpoints.define_metric("calls", "Calls")
+            endpoints.define_metric("errors", "Errors")
+            endpoints.define_metric("retries", "Retries")
+            endpoints.define_metric("circuit_open", "Open circuits")
+            endpoints.define_metric("bytes_received", "Bytes received", Units.DATA_SIZE.BYTE)
+            endpoints.define_metric("latency_p50", "Latency p50", Units.TIME.MILLISECONDS)
+            endpoints.define_metric("latency_p95", "Latency p95", Units.TIME.MILLISECONDS)
+            endpoints.define_metric("latency_p99", "Latency p99", Units.TIME.MILLISECONDS)
+        memory = adapterHealth.define_group("memory", "Memory")
+        memory.define_metric("peak_rss", "Peak RSS", Units.DATA_SIZE.MEGABYTE)
+        memory.define_metric("pressure_level", "Pressure level")
+        memory.define_string_property("peak_stage", "Collectors running at peak")
+        adapterHealth.define_metric("skipped_collectors", "Skipped collectors")
+        collectors = adapterHealth.define_group("collectors", "Collectors")
+        for collector in constants.COLLECTORS:
+            collectorGroup = collectors.define_group(collector, collector)
+            collectorGroup.define_metric("duration", "Duration", Units.TIME.SECONDS)
+            collectorGroup.define_metric("skipped", "Skipped")
+
         logger.debug(f"Returning adapter definition: {definition.to_json()}")
         return definition
 
+def get_pod_clients(adapter_instance: AdapterInstance, stats: RequestStats = None) -> Dict[str, RestClient]:
+    # One client per pod, keyed by the host of the connection server it talks to
+    port = adapter_instance.get_identifier_value(constants.PORT_IDENTIFIER)
+    hosts = [str(adapter_instance.get_identifier_value(constants.HOST_IDENTIFIER)).strip()]
+    additional_hosts = adapter_instance.get_identifier_value(constants.ADDITIONAL_HOSTS_IDENTIFIER) or ""
+    for host in additional_hosts.split(","):
+        if host.strip() and host.strip() not in hosts:
+            hosts.append(host.strip())
+    max_concurrency = get_int_parameter(adapter_instance, constants.MAX_CONCURRENT_REQUESTS_IDENTIFIER, constants.DEFAULT_MAX_CONCURRENT_REQUESTS)
+    max_rate = get_int_parameter(adapter_instance, constants.MAX_REQUESTS_PER_SECOND_IDENTIFIER, constants.DEFAULT_MAX_REQUESTS_PER_SECOND)
+    target_latency = get_int_parameter(adapter_instance, constants.TARGET_LATENCY_IDENTIFIER, constants.DEFAULT_TARGET_LATENCY) / 1000
+    streaming = str(adapter_instance.get_identifier_value(constants.STREAMING_DECODE_IDENTIFIER)).lower() == "true"
+    max_retries = get_int_parameter(adapter_instance, constants.MAX_RETRIES_IDENTIFIER, constants.DEFAULT_MAX_RETRIES)
+    timeout = get_int_parameter(adapter_instance, constants.REQUEST_TIMEOUT_IDENTIFIER, constants.DEFAULT_REQUEST_TIMEOUT)
+    strategy = adapter_instance.get_identifier_value(constants.LOAD_BALANCING_IDENTIFIER) or ROUND_ROBIN
+    servers = get_connection_servers(adapter_instance)
+    clients = {}
+    for host in hosts:
+        urls = ["https://" + server + ":" + str(port) for server in [host] + servers.get(host, [])]
+        # The limits apply to each connection server, the pod's limiter covers all of them
+        clients[host] = RestClient(
+            urls[0],
+            stats=stats,
+            limiter=AdaptiveRateLimiter(max_concurrency * len(urls), max_rate * len(urls), target_latency),
+            max_retries=max_retries,
+            servers=ServerPool(urls, strategy),
+            timeout=timeout,
+        )
+        clients[host].streaming = streaming
+    return clients
+
+def get_connection_servers(adapter_instance: AdapterInstance) -> Dict[str, List[str]]:
+    # 'host=server1|server2, ...' lists further connection servers of the pod of host
+    servers = {}
+    value = adapter_instance.get_identifier_value(constants.CONNECTION_SERVERS_IDENTIFIER) or ""
+    for entry in value.split(","):
+        if "=" not in entry:
+            if entry.strip():
+                logger.warning(f"Ignoring connection server entry '{entry.strip()}', expected host=server1|server2")
+            continue
+        host, members = entry.split("=", 1)
+        servers[host.strip()] = [member.strip() for member in members.split("|") if member.strip() and member.strip() != host.strip()]
+    return servers
+
+def get_int_parameter(adapter_instance: AdapterInstance, key: str, default: int) -> int:
+    value = adapter_instance.get_identifier_value(key)
+    try:
+        return int(value) if value not in (None, "") else default
+    except ValueError:
+        logger.warning(f"Invalid value '{value}' for {key}, using {default}")
+        return default
+
+def get_collection_interval(adapter_instance: AdapterInstance) -> float:
+    # Seconds between two collections, from the window of the current one
+    window = adapter_instance.get_collection_window() or {}
+    try:
+        interval = (int(window["end_time"]) - int(window["start_time"])) / 1000
+    except (KeyError, TypeError, ValueError):
+        interval = 0
+    return interval if interval > 0 else constants.DEFAULT_COLLECTION_INTERVAL
+
+def daemon_mode(adapter_instance: AdapterInstance) -> bool:
+    return str(adapter_instance.get_identifier_value(constants.DAEMON_MODE_IDENTIFIER)).lower() == "true"
+
+def collect_from_daemon(adapter_instance: AdapterInstance) -> Optional[SnapshotResult]:
+    # None when daemon mode is off or the daemon has no recent result, then the collection runs here
+    if not daemon_mode(adapter_instance):
+        return None
+    max_age = get_collection_interval(adapter_instance) * constants.DAEMON_MAX_AGE_CYCLES
+    return daemon.fetch(adapter_instance, max_age)
+
+def get_recorder(adapter_instance: AdapterInstance, clients: Dict[str, RestClient]) -> Optional[TrafficRecorder]:
+    # Captures the requests of this collection for an offline replay with benchmark/replay.py
+    if str(adapter_instance.get_identifier_value(constants.RECORD_TRAFFIC_IDENTIFIER)).lower() != "true":
+        return None
+    path = rotate(os.path.join(log_directory(), constants.TRAFFIC_ARCHIVE_FILE), constants.TRAFFIC_ARCHIVE_COUNT)
+    identifiers = {key: identifier.value for key, identifier in adapter_instance.get_key().identifiers.items()}
+    recorder = TrafficRecorder(path, identifiers)
+    for client in clients.values():
+        client.recorder = recorder
+    logger.info(f"Recording the requests of this collection to {path}")
+    return recorder
+
+def get_tracer(adapter_instance: AdapterInstance) -> Tracer:
+    return Tracer(adapter_instance.get_identifier_value(constants.TRACING_IDENTIFIER) or TRACING_OFF)
+
+def write_trace(tracer: Tracer) -> None:
+    # Next to adapter.log, rotated like the profiles
+    if not tracer.enabled:
+        return
+    file = constants.CHROME_TRACE_FILE if tracer.format == TRACING_CHROME else constants.OTLP_TRACE_FILE
+    try:
+        tracer.write(rotate(os.path.join(log_directory(), file), constants.TRACE_FILE_COUNT))
+    except OSError as e:
+        logger.warning(f"Unable to write the collection trace: {e}")
+
+def get_profiler(adapter_instance: AdapterInstance, method: str) -> Profiler:
+    mode = adapter_instance.get_identifier_value(constants.PROFILING_IDENTIFIER) or PROFILING_OFF
+    return Profiler(mode, method)
+
+def authenticate(adapter_instance: AdapterInstance, clients: Dict[str, RestClient]) -> None:
+    user = adapter_instance.get_credential_value(constants.USER_CREDENTIAL)
+    password = adapter_instance.get_credential_value(constants.PASSWORD_CREDENTIAL)
+    domain = adapter_instance.get_credential_value(constants.DOMAIN_CREDENTIAL)
+    for client in clients.values():
+        client.authenticate(TokenManager(client, user, password, domain))
+
+def schedule_pod(scheduler: CollectionScheduler, host: str, client: RestClient, index: ObjectIndex, cache: PersistentCache) -> str:
+    # Adds the collectors of one pod, their names are prefixed with the pod's host
+    pod = host + ":"
+    scheduler.add(pod + "get_local_pod", get_local_pod, client, index)
+    scheduler.add(pod + "get_local_desktop_pools", get_local_desktop_pools, client, index)
+    scheduler.add(pod + "get_rds_farms", get_rds_farms, client, index)
+    scheduler.add(pod + "get_local_application_pools", get_local_application_pools, client, index)
+    scheduler.add(pod + "get_rds_hosts", get_rds_hosts, client, index)
+    # Logon timings are fetched by a collector of their own, after the sessions are registered
+    pending = []
+    scheduler.add(pod + "get_local_sessions", get_local_sessions, client, index, cache, pending,
+                  requires=[pod + "get_local_desktop_pools", pod + "get_rds_farms", pod + "get_rds_hosts"])
+    scheduler.add(pod + "get_logon_timings", get_logon_timings, client, index, cache, pending, scheduler.budget,
+                  requires=[pod + "get_local_sessions"])
+    return pod
+
 def test(adapter_instance: AdapterInstance) -> TestResult:
     with Timer(logger, "Test"):
         result = TestResult()
+        clients = {}
         try:
-            host = adapter_instance.get_identifier_value(constants.HOST_IDENTIFIER)
-            port = adapter_instance.get_identifier_value(constants.PORT_IDENTIFIER)
-            base_url = "https://" + str(host) + ":" + str(port)
-            user = adapter_instance.get_credential_value(constants.USER_CREDENTIAL)
-            password = adapter_instance.get_credential_value(constants.PASSWORD_CREDENTIAL)
-            domain = adapter_instance.get_credential_value(constants.DOMAIN_CREDENTIAL)
-
-            headers = {
-                'Content-Type': 'application/json',
-                'Accept': '*/*',
-            }
-
-            payload = {
-                "username": user,
-                "password": password,
-                "domain": domain,
-            }
-            json_payload = json.dumps(payload)
-
-            client = RestClient(base_url)
-            status_code, response_data = client.post("/rest/login", headers, json_payload)
-            if status_code == 200:
-                token = response_data.get("access_token")
-                logger.info(f"token: {token}")
-            else:
-                logger.error("Error:", status_code)
-
-            return result
-
+            clients = get_pod_clients(adapter_instance)
+            authenticate(adapter_instance, clients)
+            for host in clients:
+                logger.info(f"Authenticated against {host}")
+
+            # Size every pod in parallel and extrapolate the collections from it
+            with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+                probes = list(executor.map(lambda client: CapacityProbe(client).run(), clients.values()))
+            for host, probe in zip(clients, probes):
+                logger.info(f"Inventory of {host}: {probe.counts}, page times {probe.pageTimes}, "
+                            f"samples {probe.sampleTimes}")
+            sizing = estimate(probes)
+            logger.info(f"Estimated {sizing['objects']} objects, {sizing['first_collection']}s for the first "
+                        f"collection and {sizing['collection']}s for the next ones. Recommended collection "
+                        f"interval {sizing['interval']} min, Adapter Memory Limit {sizing['memory_limit']} MB")
+
+            memory_limit = get_int_parameter(adapter_instance, "container_memory_limit", constants.DEFAULT_MEMORY_LIMIT)
+            if memory_limit < sizing["memory_limit"]:
+                result.with_error(f"About {sizing['objects']} objects will be collected, set the Adapter Memory "
+                                  f"Limit to at least {sizing['memory_limit']} MB (currently {memory_limit} MB). "
+                                  f"Recommended collection interval: {sizing['interval']} minutes")
+
+        except ProbeError as e:
+            logger.error(f"Capacity probe failed: {e}")
+            result.with_error(f"Connection server request failed: {e}")
+        except AuthenticationError as e:
+            logger.error(str(e))
+            result.with_error(str(e))
         except Exception as e:
             logger.error("Unexpected connection test error")
             logger.exception(e)
             result.with_error("Unexpected connection test error: " + repr(e))
         finally:
-            # TODO: If any connections are still open, make sure they are closed before returning
+            for client in clients.values():
+                client.close()
             logger.debug(f"Returning test result: {result.get_json()}")
             return result
 
-def collect(adapter_instance: AdapterInstance) -> CollectResult:
+def collect(adapter_instance: AdapterInstance, clients: Dict[str, RestClient] = None) -> CollectResult:
     with Timer(logger, "Collection"):
         result = CollectResult()
+        start = time.perf_counter()
+        stats = RequestStats()
+        scheduler = None
+        # The daemon passes the clients it keeps authenticated across collections
+        owned = clients is None
+        if owned:
+            clients = {}
+        # While the daemon of this instance is starting or late it owns the cache, sessions
+        # snapshot and logon timings included, and a collection run here only reads it
+        read_only = owned and daemon_mode(adapter_instance) and daemon.running(adapter_instance)
+        cache = None
+        governor = None
+        recorder = None
+        tracer = get_tracer(adapter_instance)
         try:
-            host = adapter_instance.get_identifier_value(constants.HOST_IDENTIFIER)
-            port = adapter_instance.get_identifier_value(constants.PORT_IDENTIFIER)
-            base_url = "https://" + str(host) + ":" + str(port)
-
-            user = adapter_instance.get_credential_value(constants.USER_CREDENTIAL)
-            password = adapter_instance.get_credential_value(constants.PASSWORD_CREDENTIAL)
-            domain = adapter_instance.get_credential_value(constants.DOMAIN_CREDENTIAL)
-
-            headers = {
-                'Content-Type': 'application/json',
-                'Accept': '*/*',
-            }
-            payload = {
-                "username": user,
-                "password": password,
-                "domain": domain, 
-            }
-
-            json_payload = json.dumps(payload)
-
-            client = RestClient(base_url)
-            status_code, response_data = client.post("/rest/login", headers, json_payload)
-
-            if status_code == 200:
-                token = response_data.get("access_token")
+            if owned:
+                clients = get_pod_clients(adapter_instance, stats)
+                authenticate(adapter_instance, clients)
             else:
-                logger.error("Error:", status_code)
-
-            global_Desktop_Pools = get_global_desktop_pools(host, port, token, 1)
-            global_Application_Pools = get_global_application_pools(host, port, token, 1)
-
-            local_Pods = get_local_pod(host, port, token, global_Desktop_Pools, global_Application_Pools)
-            local_Sites = get_local_site(host, port, token, local_Pods)
-            local_Desktop_Pools = get_local_desktop_pools(host, port, token, 1, global_Desktop_Pools)
-            
-            rds_farms = get_rds_farms(host, port, token, 1 )
-            
-            local_Application_Pools = get_local_application_pools(host, port, token, 1, rds_farms, global_Application_Pools)
-            rds_hosts = get_rds_hosts(host, port, token, 1, rds_farms)
-            
-            local_Sessions = get_local_sessions(host, port, token, 1, local_Desktop_Pools, rds_farms, rds_hosts)
-
-            result.add_objects(global_Desktop_Pools)
-            result.add_objects(global_Application_Pools)
-            result.add_objects(local_Pods)
-            result.add_objects(local_Sites)
-            result.add_objects(local_Desktop_Pools)
-            result.add_objects(local_Application_Pools)
-            result.add_objects(rds_farms)
-            result.add_objects(rds_hosts)
-            result.add_objects(local_Sessions)
-
+                # Each collection works on its own copies of the clients kept by the daemon
+                clients = {host: client.for_cycle(stats) for host, client in clients.items()}
+            recorder = get_recorder(adapter_instance, clients)
+
+            for client in clients.values():
+                client.tracer = tracer
+
+            with tracer.span("collection", pods=len(clients)) as cycle:
+                index = ObjectIndex()
+                refresh = get_int_parameter(adapter_instance, constants.INVENTORY_REFRESH_IDENTIFIER, constants.DEFAULT_INVENTORY_REFRESH) * 60
+                cache = PersistentCache(ttls=dict(constants.CACHE_TTLS, inventorySnapshot=refresh), read_only=read_only)
+                if not recorder:
+                    # A recording holds whole answers so it replays from an empty cache
+                    for client in clients.values():
+                        client.validators.cache = cache
+
+                # Global entitlements and sites are federation wide and fetched once, every
+                # other collector runs against the connection server of each pod. Collectors
+                # only wait for the collectors whose objects they look up
+                primary = next(iter(clients.values()))
+                # Each collector gets a share of the collection interval and the cycle ends
+                # before the next one is due, with whatever was collected by then
+                interval = get_collection_interval(adapter_instance)
+                deadline = time.monotonic() + interval * constants.CYCLE_BUDGET_RATIO
+                for client in clients.values():
+                    client.deadline = deadline
+                scheduler = CollectionScheduler(
+                    max_workers=constants.COLLECTOR_WORKERS * len(clients),
+                    deadline=deadline,
+                    budget=interval * constants.COLLECTOR_BUDGET_RATIO,
+                    tracer=tracer,
+                )
+                scheduler.add("get_global_desktop_pools", get_global_desktop_pools, primary, index)
+                scheduler.add("get_global_application_pools", get_global_application_pools, primary, index)
+                pods = [schedule_pod(scheduler, host, client, index, cache) for host, client in clients.items()]
+                scheduler.add("get_local_site", get_local_site, primary, index,
+                              requires=[pod + "get_local_pod" for pod in pods])
+
+                # Inventory kinds are only refetched once their snapshot is older than the
+                # refresh interval, RDS hosts and sessions are collected every cycle
+                snapshots = None
+                if refresh > 0:
+                    snapshots = InventorySnapshots(cache, index, primary.base_url)
+                    snapshots.apply(scheduler)
+
+                governor = MemoryGovernor(
+                    get_int_parameter(adapter_instance, "container_memory_limit", constants.DEFAULT_MEMORY_LIMIT),
+                    clients.values(),
+                    scheduler,
+                )
+                governor.start()
+                collected = scheduler.run()
+                index.freeze()
+                if snapshots:
+                    with tracer.span("save_snapshots"):
+                        snapshots.save(collected)
+
+                with tracer.span("link"):
+                    index.link()
+
+                # Skipped collectors contribute the objects they registered before giving up
+                result.add_objects(index.all_objects())
+                cycle.set("objects", len(result.objects))
+
+        except AuthenticationError as e:
+            logger.error(str(e))
+            result.with_error(str(e))
         except Exception as e:
             logger.error("Unexpected collection error")
             logger.exception(e)
             result.with_error("Unexpected collection error: " + repr(e))
         finally:
-            # TODO: If any connections are still open, make sure they are closed before returning
+            if governor:
+                governor.stop()
+            if recorder:
+                for client in clients.values():
+                    client.recorder = None
+                recorder.close()
+            write_trace(tracer)
+            for host, client in clients.items():
+                logger.info(f"HTTP connection stats for {host}: {client.connection_stats()}, "
+                            f"concurrency limit {int(client.limiter.limit)}, servers {client.servers.summary()}, "
+                            f"conditional GETs {client.validators.summary()}")
+                client.tracer = NULL_TRACER
+                client.validators.cache = None
+                if owned:
+                    client.close()
+                else:
+                    # Collectors abandoned at the deadline may still hold this copy
+                    client.deadline = 0
+            if cache:
+                cache.evict()
+                cache.close()
+            result.add_object(get_adapter_health(
+                str(adapter_instance.get_identifier_value(constants.HOST_IDENTIFIER)),
+                stats,
+                scheduler.durations if scheduler else {},
+                time.perf_counter() - start,
+                len(result.objects),
+                governor,
+                scheduler.skipped if scheduler else {},
+            ))
             logger.debug(f"Returning collection result {result.get_json()}")
             return result
 
@@ -301,11 +692,19 @@ def main(argv: List[str]) -> None:
     method = argv[0]
     try:
         if method == "test":
-            test(AdapterInstance.from_input()).send_results()
+            adapter_instance = AdapterInstance.from_input()
+            with get_profiler(adapter_instance, method):
+                result = test(adapter_instance)
+            result.send_results()
         elif method == "endpoint_urls":
             get_endpoints(AdapterInstance.from_input()).send_results()
         elif method == "collect":
-            collect(AdapterInstance.from_input()).send_results()
+            adapter_instance = AdapterInstance.from_input()
+            result = collect_from_daemon(adapter_instance)
+            if result is None:
+                with get_profiler(adapter_instance, method):
+                    result = collect(adapter_instance)
+            result.send_results()
         elif method == "adapter_definition":
             result = get_adapter_definition()
             if type(result) is AdapterDefinition:
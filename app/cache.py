@@ -0,0 +1,145 @@
+import aria.ops.adapter_logging as logging
+import constants
+import json
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class PersistentCache:
+    """
+    Slow-changing entities (AD users, machines, ...) kept across collections in a
+    SQLite database in the adapter's working directory, keyed by entity type and
+    id. Entries expire after the TTL of their type and the least recently used
+    ones are evicted once the cache holds more than max_entries. The database is
+    opened in WAL mode so several adapter instances can share it. Entries that
+    belong to one connection server use a scoped type, 'type@scope', which shares
+    the TTL of 'type'. Errors are logged and treated as cache misses, the cache
+    never fails a collection. A read only cache drops every write, for a
+    collection running next to the daemon that owns the cache.
+    """
+    def __init__(self, path=constants.CACHE_FILE, ttls=constants.CACHE_TTLS, max_entries=constants.CACHE_MAX_ENTRIES,
+                 read_only=False):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        try:
+            self.connection = self._connect(path)
+        except sqlite3.Error as e:
+            logger.warning(f"Cannot open cache '{path}', using an in-memory cache: {e}")
+            self.connection = self._connect(":memory:")
+
+    def _connect(self, path):
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "type TEXT NOT NULL, id TEXT NOT NULL, value TEXT NOT NULL, "
+            "updated REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (type, id))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        return connection
+
+    def get_many(self, type, ids):
+        ids = list(ids)
+        values = {}
+        if not ids:
+            return values
+        now = time.time()
+        oldest = now - self._ttl(type)
+        try:
+            with self.lock:
+                for start in range(0, len(ids), constants.CACHE_BATCH_SIZE):
+                    chunk = ids[start:start + constants.CACHE_BATCH_SIZE]
+                    rows = self.connection.execute(
+                        "SELECT id, value FROM cache WHERE type = ? AND updated >= ? AND id IN ("
+                        + ",".join("?" * len(chunk)) + ")",
+                        [type, oldest] + chunk,
+                    ).fetchall()
+                    for id, value in rows:
+                        values[id] = json.loads(value)
+                if self.read_only:
+                    return values
+                self.connection.executemany(
+                    "UPDATE cache SET accessed = ? WHERE type = ? AND id = ?",
+                    [(now, type, id) for id in values],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Cache read failed: {e}")
+        return values
+
+    def get(self, type, id):
+        return self.get_many(type, [id]).get(id)
+
+    def put_many(self, type, values):
+        if not values or self.read_only:
+            return
+        now = time.time()
+        try:
+            with self.lock:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO cache (type, id, value, updated, accessed) VALUES (?, ?, ?, ?, ?)",
+                    [(type, id, json.dumps(value), now, now) for id, value in values.items()],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Cache write failed: {e}")
+
+    def put(self, type, id, value):
+        self.put_many(type, {id: value})
+
+    def invalidate(self, type, id):
+        if self.read_only:
+            return
+        try:
+            with self.lock:
+                self.connection.execute("DELETE FROM cache WHERE type = ? AND id = ?", (type, id))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache invalidation failed: {e}")
+
+    def retain(self, type, ids):
+        # Drops every entry of the type whose id is not in ids
+        if self.read_only:
+            return
+        try:
+            with self.lock:
+                self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS retained (id TEXT PRIMARY KEY)")
+                self.connection.execute("DELETE FROM retained")
+                self.connection.executemany("INSERT OR IGNORE INTO retained (id) VALUES (?)", [(id,) for id in ids])
+                self.connection.execute(
+                    "DELETE FROM cache WHERE type = ? AND id NOT IN (SELECT id FROM retained)", (type,)
+                )
+                self.connection.execute("DELETE FROM retained")
+        except sqlite3.Error as e:
+            logger.warning(f"Cache retain failed: {e}")
+
+    def evict(self):
+        # Drops expired entries, then the least recently used ones above max_entries
+        if self.read_only:
+            return
+        now = time.time()
+        try:
+            with self.lock:
+                for type, ttl in self.ttls.items():
+                    self.connection.execute(
+                        "DELETE FROM cache WHERE (type = ? OR type LIKE ?) AND updated < ?",
+                        (type, type + "@%", now - ttl),
+                    )
+                count = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+                if count > self.max_entries:
+                    self.connection.execute(
+                        "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY accessed LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"Cache eviction failed: {e}")
+
+    def _ttl(self, type):
+        return self.ttls.get(type.split("@")[0], constants.CACHE_DEFAULT_TTL)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Cache close failed: {e}")
@@ -0,0 +1,168 @@
+import aria.ops.adapter_logging as logging
+import constants
+import json
+import math
+import statistics
+import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from restcall import RestClient
+
+logger = logging.getLogger(__name__)
+
+COUNTED_ENDPOINTS = {
+    "sessions": '/rest/inventory/v1/sessions',
+    "rdsHosts": '/rest/inventory/v1/rds-servers',
+    "farms": '/rest/inventory/v4/farms',
+    "desktopPools": '/rest/inventory/v6/desktop-pools',
+    "applicationPools": '/rest/inventory/v3/application-pools',
+    "machines": '/rest/inventory/v1/machines',
+}
+# Only logged, the collection does not depend on them
+OPTIONAL_COUNTS = ["machines"]
+
+class ProbeError(Exception):
+    pass
+
+class CapacityProbe:
+    """
+    Sizes the inventory of one pod without collecting it. Each paged endpoint is
+    counted from its first page, and when that page is full the rest is counted
+    with single item pages, galloping then bisecting on the item number. The
+    first pages also time the inventory endpoints, a few federation, AD user,
+    machine and logon timing requests time the other endpoint families. Only a
+    failed count of a core inventory endpoint fails the probe, a failed sample is
+    left out of the estimate.
+    """
+    def __init__(self, client: RestClient):
+        self.client = client
+        self.counts = {}
+        self.pageTimes = {}
+        self.sampleTimes = {}
+        self.firstSessions = []
+        self.vdiShare = 0
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=len(COUNTED_ENDPOINTS) + 1) as executor:
+            counts = {kind: executor.submit(self._count, kind, endpoint) for kind, endpoint in COUNTED_ENDPOINTS.items()}
+            sample = executor.submit(self._time_sample, "federation", '/rest/federation/v1/pods')
+            for kind, future in counts.items():
+                try:
+                    future.result()
+                except ProbeError as e:
+                    if kind not in OPTIONAL_COUNTS:
+                        raise
+                    logger.warning(f"Cannot count {kind}: {e}")
+            sample.result()
+        self._time_enrichment()
+        return self
+
+    def _timed_get(self, endpoint):
+        start = time.perf_counter()
+        status_code, response_data = self.client.get(endpoint)
+        elapsed = time.perf_counter() - start
+        if status_code != 200 or response_data is None:
+            raise ProbeError(f"{self.client.base_url}{endpoint.split('?')[0]} answered {status_code}")
+        return response_data, elapsed
+
+    def _count(self, kind, endpoint):
+        size = constants.PAGE_SIZE
+        firstPage, elapsed = self._timed_get(f"{endpoint}?size={size}&page=1")
+        self.pageTimes[kind] = elapsed
+        if kind == "sessions":
+            self.firstSessions = firstPage
+        if len(firstPage) < size:
+            self.counts[kind] = len(firstPage)
+            return
+
+        # Item number low is known to exist and high is known not to
+        low, high = size, size * 2
+        while self._exists(endpoint, high):
+            low, high = high, high * 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self._exists(endpoint, middle):
+                low = middle
+            else:
+                high = middle
+        self.counts[kind] = low
+
+    def _exists(self, endpoint, number):
+        items, _ = self._timed_get(f"{endpoint}?size=1&page={number}")
+        return len(items) == 1
+
+    def _time_sample(self, family, endpoint):
+        try:
+            _, elapsed = self._timed_get(endpoint)
+        except (ProbeError, requests.RequestException) as e:
+            logger.warning(f"Skipping the {family} sample: {e}")
+            return
+        self.sampleTimes.setdefault(family, []).append(elapsed)
+
+    def _time_enrichment(self):
+        # The lookups the sessions collector makes, on the sessions of the first page
+        sessions = self.firstSessions[:constants.FILTER_CHUNK_SIZE]
+        userIds = [obj["user_id"] for obj in sessions if obj.get("user_id")]
+        machineIds = [obj["machine_id"] for obj in sessions if obj.get("machine_id")]
+        if userIds:
+            filter = quote(json.dumps({"type": "In", "name": "id", "value": userIds}))
+            self._time_sample("adUsers", '/rest/external/v1/ad-users-or-groups?filter=' + filter)
+        if machineIds:
+            filter = quote(json.dumps({"type": "In", "name": "id", "value": machineIds}))
+            self._time_sample("machines", '/rest/inventory/v1/machines?filter=' + filter)
+        # Logon timings are fetched in parallel, what counts is the time per session
+        # of a batch fetched on as many workers as the collector uses
+        sessionIds = [obj["id"] for obj in sessions[:constants.PROBE_SAMPLE_SIZE]]
+        if sessionIds:
+            start = time.perf_counter()
+            try:
+                with ThreadPoolExecutor(max_workers=constants.LOGON_TIMING_WORKERS) as executor:
+                    list(executor.map(lambda id: self.client.get('/rest/helpdesk/v1/logon-timing/logon-segment?session_id=' + id), sessionIds))
+                self.sampleTimes["logonTiming"] = [(time.perf_counter() - start) / len(sessionIds)]
+            except requests.RequestException as e:
+                logger.warning(f"Skipping the logonTiming sample: {e}")
+        self.vdiShare = len(machineIds) / len(sessions) if sessions else 0
+
+    def sample_time(self, name):
+        return statistics.median(self.sampleTimes[name]) if name in self.sampleTimes else 0
+
+    def collection_time(self, churn):
+        # Sessions are paged and resolved by one collector while the other
+        # inventory endpoints are collected alongside, the longest of those counts
+        def paging(kind):
+            return math.ceil(self.counts.get(kind, 0) / constants.PAGE_SIZE) * self.pageTimes.get(kind, 0)
+
+        sessions = self.counts.get("sessions", 0) * churn
+        enrichment = (
+            math.ceil(sessions / constants.FILTER_CHUNK_SIZE) * self.sample_time("adUsers")
+            + math.ceil(sessions * self.vdiShare / constants.FILTER_CHUNK_SIZE) * self.sample_time("machines")
+            + sessions * self.sample_time("logonTiming")
+        )
+        others = max(paging(kind) for kind in ("rdsHosts", "farms", "desktopPools", "applicationPools"))
+        return self.sample_time("federation") + others + paging("sessions") + enrichment
+
+    def object_count(self):
+        return sum(count for kind, count in self.counts.items() if kind != "machines")
+
+def estimate(probes):
+    """
+    Extrapolates the duration of the first collection, where every session is
+    resolved, and of the following ones, where only new sessions are, from the
+    probes of all pods, which are collected at the same time. Returns those and
+    the recommended collection interval in minutes and memory limit in MB.
+    """
+    first = max(probe.collection_time(1) for probe in probes)
+    steady = max(probe.collection_time(constants.PROBE_CHURN_ESTIMATE) for probe in probes)
+    interval = max(math.ceil(steady / constants.CYCLE_BUDGET_RATIO / 60), constants.DEFAULT_COLLECTION_INTERVAL // 60)
+    objects = sum(probe.object_count() for probe in probes)
+    memory = (constants.PROBE_BASE_MEMORY + objects * constants.PROBE_OBJECT_MEMORY / 1024) * constants.PROBE_MEMORY_HEADROOM
+    memory = max(math.ceil(memory / 256) * 256, constants.DEFAULT_MEMORY_LIMIT)
+    return {
+        "objects": objects,
+        "first_collection": round(first, 1),
+        "collection": round(steady, 1),
+        "interval": interval,
+        "memory_limit": memory,
+    }
@@ -0,0 +1,35 @@
+import aria.ops.adapter_logging as logging
+import constants
+import threading
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """
+    Counts consecutive failed requests per endpoint family of one connection
+    server. Once a family reaches the threshold its circuit opens and stays open
+    for the rest of the collection, requests to it fail immediately instead of
+    spending the collection interval on retries and timeouts.
+    """
+    def __init__(self, name, threshold=constants.CIRCUIT_BREAKER_THRESHOLD):
+        self.name = name
+        self.threshold = threshold
+        self.failures = {}
+        self.open = set()
+        self.lock = threading.Lock()
+
+    def allow(self, family):
+        return family not in self.open
+
+    def record(self, family, ok):
+        with self.lock:
+            if ok:
+                self.failures[family] = 0
+                return False
+            self.failures[family] = self.failures.get(family, 0) + 1
+            if self.failures[family] >= self.threshold and family not in self.open:
+                self.open.add(family)
+                logger.error(f"Circuit open for {family} endpoints of {self.name} after "
+                             f"{self.failures[family]} consecutive failures, skipping them for the rest of the collection")
+                return True
+            return False
@@ -5,3 +5,111 @@ PORT_IDENTIFIER = "port"
 USER_CREDENTIAL = "user"
 PASSWORD_CREDENTIAL = "password"
 DOMAIN_CREDENTIAL = "domain"
+HTTP_POOL_SIZE = 16
+FILTER_CHUNK_SIZE = 50
+PAGE_SIZE = 1000
+COLLECTOR_WORKERS = 4
+CACHE_FILE = "adapter_cache.db"
+CACHE_DEFAULT_TTL = 3600
+CACHE_TTLS = {
+    "adUser": 86400,
+    "machine": 3600,
+    "logonTiming": 604800,
+    "sessionSnapshot": 3600,
+    "validator": 604800,
+}
+CACHE_MAX_ENTRIES = 200000
+CACHE_BATCH_SIZE = 500
+TOKEN_FILE = "adapter_tokens.json"
+SECRET_FILE = "adapter_secret"
+SECRET_SIZE = 32
+ACCESS_TOKEN_LIFETIME = 1800
+REFRESH_TOKEN_LIFETIME = 28800
+TOKEN_EXPIRY_MARGIN = 60
+LOGON_TIMING_WORKERS = 8
+# Share of its budget after which get_logon_timings stops waiting for answers
+LOGON_TIMING_BUDGET_RATIO = 0.9
+ADDITIONAL_HOSTS_IDENTIFIER = "additional_hosts"
+ENDPOINT_FAMILIES = ["inventory", "federation", "helpdesk", "external"]
+COLLECTORS = [
+    "get_global_desktop_pools",
+    "get_global_application_pools",
+    "get_local_pod",
+    "get_local_site",
+    "get_local_desktop_pools",
+    "get_rds_farms",
+    "get_local_application_pools",
+    "get_rds_hosts",
+    "get_local_sessions",
+    "get_logon_timings",
+]
+MAX_CONCURRENT_REQUESTS_IDENTIFIER = "max_concurrent_requests"
+MAX_REQUESTS_PER_SECOND_IDENTIFIER = "max_requests_per_second"
+TARGET_LATENCY_IDENTIFIER = "target_latency"
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+DEFAULT_MAX_REQUESTS_PER_SECOND = 0
+DEFAULT_TARGET_LATENCY = 2000
+STREAM_CHUNK_SIZE = 65536
+STREAMING_DECODE_IDENTIFIER = "streaming_decode"
+SESSION_FIELDS = ["id", "user_id", "desktop_pool_id", "farm_id", "machine_id", "rds_server_id",
+                  "session_state", "session_type", "agent_version", "session_protocol"]
+DEFAULT_MEMORY_LIMIT = 1024
+MEMORY_SAMPLE_INTERVAL = 0.5
+MEMORY_PRESSURE_THRESHOLD = 0.7
+MEMORY_CRITICAL_THRESHOLD = 0.85
+MIN_PAGE_SIZE = 100
+INVENTORY_REFRESH_IDENTIFIER = "inventory_refresh_interval"
+DEFAULT_INVENTORY_REFRESH = 30
+INVENTORY_COLLECTORS = ["get_global_desktop_pools", "get_global_application_pools", "get_local_pod",
+                        "get_local_site", "get_local_desktop_pools", "get_rds_farms", "get_local_application_pools"]
+SESSION_CHURN_METRICS = ["sessions_started", "sessions_ended"]
+DEFAULT_COLLECTION_INTERVAL = 300
+CYCLE_BUDGET_RATIO = 0.8
+COLLECTOR_BUDGET_RATIO = 0.6
+MAX_RETRIES_IDENTIFIER = "max_retries"
+DEFAULT_MAX_RETRIES = 3
+# Seconds, a request never outlives what is left of the cycle either
+REQUEST_TIMEOUT_IDENTIFIER = "request_timeout"
+CONNECT_TIMEOUT = 10
+DEFAULT_REQUEST_TIMEOUT = 60
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 10
+CIRCUIT_BREAKER_THRESHOLD = 5
+CONNECTION_SERVERS_IDENTIFIER = "connection_servers"
+LOAD_BALANCING_IDENTIFIER = "load_balancing"
+SERVER_COOLDOWN = 60
+LATENCY_SMOOTHING = 0.2
+PROFILING_IDENTIFIER = "profiling"
+PROFILE_TOP_N = 25
+PROFILE_TRACEBACK_DEPTH = 10
+PROFILE_FILE_COUNT = 5
+PROBE_SAMPLE_SIZE = 32
+PROBE_CHURN_ESTIMATE = 0.1
+PROBE_BASE_MEMORY = 64
+PROBE_OBJECT_MEMORY = 12
+PROBE_MEMORY_HEADROOM = 1.5
+DAEMON_MODE_IDENTIFIER = "daemon_mode"
+DAEMON_TIMEOUT = 10
+DAEMON_MAX_AGE_CYCLES = 2
+DAEMON_IDLE_CYCLES = 3
+DAEMON_LOG_MAX_SIZE = 10_489_760
+RECORD_TRAFFIC_IDENTIFIER = "record_traffic"
+TRAFFIC_ARCHIVE_FILE = "collect_traffic.jsonl.gz"
+TRAFFIC_ARCHIVE_COUNT = 3
+REDACTED_HEADERS = ["authorization", "cookie", "set-cookie"]
+REDACTED_FIELDS = ["password", "access_token", "refresh_token"]
+TRACING_IDENTIFIER = "tracing"
+CHROME_TRACE_FILE = "collect_trace.json"
+OTLP_TRACE_FILE = "collect_trace.otlp.json"
+TRACE_FILE_COUNT = 5
+VALIDATOR_CACHE_TYPE = "validator"
+CONDITIONAL_ENDPOINTS = [
+    "/rest/federation/v1/pods",
+    "/rest/federation/v1/sites",
+    "/rest/inventory/v1/global-desktop-entitlements",
+    "/rest/inventory/v2/global-application-entitlements",
+    "/rest/inventory/v4/farms",
+    "/rest/inventory/v6/desktop-pools",
+    "/rest/inventory/v3/application-pools",
+]
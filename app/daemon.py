@@ -0,0 +1,227 @@
+"""
+Daemon mode. A long-lived process per adapter instance collects on its own
+schedule, keeping the pod clients, their connections and tokens warm, and
+serves the latest collection result over a Unix socket in the adapter's
+working directory. `adapter.py collect` then only reads that result. When the
+daemon is not running, or its result is missing or stale, the collect command
+starts it and collects in process as usual.
+
+The daemon holds a lock on <socket>.lock for its whole life, the lock is
+released by the kernel when it exits or crashes, so a new daemon is started at
+most once per crash. It exits by itself when nobody asked for a result for a
+few collection intervals, e.g. after daemon mode was turned off. A daemon that
+holds the lock but has had no fresh result for longer than a result may be old
+is stuck, the collect command kills it and starts a new one.
+"""
+import aria.ops.adapter_logging as logging
+import constants
+import fcntl
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from aria.ops.adapter_instance import AdapterInstance
+from aria.ops.pipe_utils import write_to_pipe
+from installSecret import keyed_digest
+
+logger = logging.getLogger(__name__)
+
+class SnapshotResult:
+    """A collection result read from the daemon, sent on like a CollectResult."""
+    def __init__(self, json):
+        self.json = json
+
+    def get_json(self):
+        return self.json
+
+    def send_results(self, output_pipe=sys.argv[-1]):
+        write_to_pipe(output_pipe, self.json)
+
+def instance_json(adapter_instance: AdapterInstance):
+    # The input the daemon needs to build the same adapter instance
+    key = adapter_instance.get_key()
+    return {
+        "adapter_key": {
+            "name": key.name,
+            "adapter_kind": key.adapter_kind,
+            "object_kind": key.object_kind,
+            "identifiers": [
+                {"key": identifier.key, "value": identifier.value, "is_part_of_uniqueness": identifier.is_part_of_uniqueness}
+                for identifier in key.identifiers.values()
+            ],
+        },
+        "credential_config": {
+            "credential_key": adapter_instance.credential_type,
+            "credential_fields": [{"key": name, "value": value} for name, value in adapter_instance.credentials.items()],
+        },
+        "collection_window": adapter_instance.collection_window,
+    }
+
+def socket_path(adapter_instance: AdapterInstance):
+    # One daemon per configuration, a changed parameter or password starts a new one. The
+    # name is world listable, so it is keyed with the install secret
+    instance = instance_json(adapter_instance)
+    del instance["collection_window"]
+    digest = keyed_digest(json.dumps(instance, sort_keys=True))[:16]
+    return os.path.join(os.getcwd(), f"adapter_daemon_{digest}.sock")
+
+def fetch(adapter_instance: AdapterInstance, max_age):
+    """
+    Returns the latest result of the daemon of the adapter instance, or None when
+    the caller has to collect in process, after starting the daemon if needed.
+    """
+    path = socket_path(adapter_instance)
+    try:
+        response = request(path)
+    except (OSError, ValueError) as e:
+        logger.info(f"Collection daemon not available ({e}), collecting in process")
+        if locked(path) and time.time() - os.path.getmtime(path + ".lock") > max_age:
+            restart(adapter_instance, path, "holds its lock but does not answer")
+        else:
+            start(adapter_instance, path)
+        return None
+    # Until its first result, the age is the time since the daemon started
+    age = time.time() - response.get("collected_at", response.get("started_at", 0))
+    if age > max_age:
+        restart(adapter_instance, path, f"has no result of the last {age:.0f}s")
+        return None
+    if response.get("result") is None:
+        logger.info("Collection daemon has no result yet, collecting in process")
+        return None
+    logger.info(f"Returning the collection daemon result of {age:.0f}s ago")
+    return SnapshotResult(response["result"])
+
+def running(adapter_instance: AdapterInstance):
+    # True while a daemon of the adapter instance holds its lock, starting or collecting
+    return locked(socket_path(adapter_instance))
+
+def locked(path):
+    with open(path + ".lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        return False
+
+def request(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(constants.DAEMON_TIMEOUT)
+        connection.connect(path)
+        connection.sendall(b"collect\n")
+        chunks = []
+        while True:
+            chunk = connection.recv(constants.STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+def restart(adapter_instance: AdapterInstance, path, reason):
+    # The kernel releases the lock of the killed daemon once it has exited
+    logger.warning(f"Collection daemon {reason}, restarting it and collecting in process")
+    try:
+        with open(path + ".lock") as file:
+            os.kill(int(file.read()), signal.SIGKILL)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Cannot stop the collection daemon: {e}")
+        return
+    stopping = time.monotonic() + constants.DAEMON_TIMEOUT
+    while locked(path) and time.monotonic() < stopping:
+        time.sleep(0.1)
+    start(adapter_instance, path)
+
+def start(adapter_instance: AdapterInstance, path):
+    # Opened without truncating, the file holds the pid of the daemon owning the lock
+    lock = open(path + ".lock", "a")
+    try:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # A daemon holds the lock, it is starting or busy
+            return
+        if os.path.exists(path):
+            os.remove(path)
+        # The child inherits the locked file and keeps it locked once this process exits
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            pass_fds=[lock.fileno()],
+            start_new_session=True,
+        )
+        # Credentials go through a pipe, never through the command line or a file
+        process.stdin.write(json.dumps(instance_json(adapter_instance)).encode())
+        process.stdin.close()
+        logger.info(f"Started collection daemon {process.pid} on {path}")
+    finally:
+        lock.close()
+
+class CollectionDaemon:
+    def __init__(self, adapter_instance: AdapterInstance, path):
+        self.adapter_instance = adapter_instance
+        self.path = path
+        self.response = json.dumps({"started_at": time.time(), "result": None}).encode()
+        self.last_request = time.monotonic()
+
+    def serve(self):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.rfile.readline()
+                daemon.last_request = time.monotonic()
+                self.wfile.write(daemon.response)
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.umask(0o077)
+        server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def run(self):
+        # Imported here, adapter imports this module for the thin client
+        import adapter
+
+        interval = adapter.get_collection_interval(self.adapter_instance)
+        clients = adapter.get_pod_clients(self.adapter_instance)
+        adapter.authenticate(self.adapter_instance, clients)
+        server = self.serve()
+        try:
+            while time.monotonic() - self.last_request < interval * constants.DAEMON_IDLE_CYCLES:
+                start = time.monotonic()
+                result = adapter.collect(self.adapter_instance, clients)
+                self.response = json.dumps({"collected_at": time.time(), "result": result.get_json()}).encode()
+                time.sleep(max(interval - (time.monotonic() - start), 0))
+            logger.info("No collection requested for a while, stopping")
+        finally:
+            server.shutdown()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            for client in clients.values():
+                client.close()
+
+def main(argv):
+    # The daemon outlives many collections, its log rotates by size instead of per run
+    logging.setup_logging("adapter_daemon.log", max_size=constants.DAEMON_LOG_MAX_SIZE)
+    path = argv[0]
+    try:
+        adapter_instance = AdapterInstance(json.loads(sys.stdin.read()))
+        logger.info(f"Collection daemon {os.getpid()} serving {path}")
+        # Next to the lock it inherited, for a collect command that has to kill it
+        with open(path + ".lock", "w") as file:
+            file.write(str(os.getpid()))
+        CollectionDaemon(adapter_instance, path).run()
+    except Exception as e:
+        logger.exception(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
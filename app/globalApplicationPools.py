@@ -9,6 +9,7 @@ from aria.ops.data import Property
 from aria.ops.object import Identifier
 from aria.ops.object import Key
 
+from linker import ObjectIndex
 from restcall import RestClient
 
 logger = logging.getLogger(__name__)
@@ -26,30 +27,17 @@ class globalApplicationPool(Object):
             )
         )
 
-def get_global_application_pools(host, port, token, page) -> List[globalApplicationPool]:
+def get_global_application_pools(client: RestClient, index: ObjectIndex) -> List[globalApplicationPool]:
         globalApplicationPools = []
-        size = 1000
-        base_url = "https://" + str(host) + ":" + str(port)
-        headers = {
-            'Authorization': 'Bearer ' + token,
-        }
-        client = RestClient(base_url)
-        # Make a GET request to the device endpoint
-        queryString = '/rest/inventory/v2/global-application-entitlements?size=' + str(size) + '&page=' + str(page)
-        status_code, response_data = client.get(queryString, headers)
-        if status_code == 200:
-            for obj in response_data:
-                logger.info("Global Pool ID:" + obj["id"])
-                logger.info("Global Pool:" + obj["name"])
-                # creating object and adding it to the result set
-                new_pool = globalApplicationPool(obj["name"], obj["id"])
-                new_pool.with_property("id", obj["id"])
-                new_pool.with_property("scope", obj["scope"])
-                new_pool.with_metric("enabled", obj["enabled"])
-                globalApplicationPools.append(new_pool)
-            if len(response_data) == size:
-                get_global_application_pools(host, port, token, page +1)
-        else:
-            logger.error("Error:", status_code)
+        for obj in client.paginate('/rest/inventory/v2/global-application-entitlements'):
+            logger.info("Global Pool ID:" + obj["id"])
+            logger.info("Global Pool:" + obj["name"])
+            # creating object and adding it to the result set
+            new_pool = globalApplicationPool(obj["name"], obj["id"])
+            new_pool.with_property("id", obj["id"])
+            new_pool.with_property("scope", obj["scope"])
+            new_pool.with_metric("enabled", obj["enabled"])
+            index.register(new_pool)
+            globalApplicationPools.append(new_pool)
 
         return globalApplicationPools
\ No newline at end of file
@@ -0,0 +1,56 @@
+import aria.ops.adapter_logging as logging
+import constants
+import hashlib
+import hmac
+import os
+
+logger = logging.getLogger(__name__)
+
+_secret = None
+
+def keyed_digest(*parts):
+    """
+    HMAC of the parts with a random secret of this adapter install, for names
+    and keys derived from credentials. Unlike a plain hash of the credentials,
+    the digest cannot be checked against guessed passwords without the secret.
+    """
+    message = "|".join(str(part) for part in parts).encode()
+    return hmac.new(secret(), message, hashlib.sha256).hexdigest()
+
+def secret(path=constants.SECRET_FILE):
+    global _secret
+    if _secret is None:
+        _secret = _load(path)
+    return _secret
+
+def _load(path):
+    try:
+        with open(path, "rb") as file:
+            value = file.read()
+        if len(value) == constants.SECRET_SIZE:
+            return value
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Cannot read install secret '{path}': {e}")
+    value = os.urandom(constants.SECRET_SIZE)
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        descriptor = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(value)
+        # Another process may have created it meanwhile, its secret wins unless it is damaged
+        try:
+            os.link(temp, path)
+        except FileExistsError:
+            with open(path, "rb") as file:
+                existing = file.read()
+            if len(existing) == constants.SECRET_SIZE:
+                value = existing
+            else:
+                os.replace(temp, path)
+        if os.path.exists(temp):
+            os.remove(temp)
+    except OSError as e:
+        logger.warning(f"Cannot write install secret '{path}', keys will not outlive this run: {e}")
+    return value
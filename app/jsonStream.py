@@ -0,0 +1,92 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+# What iter_array expects next
+_OPEN, _FIRST, _ITEM, _SEPARATOR, _CLOSED = range(5)
+
+def project(item, fields):
+    # Keeps only the attributes a collector reads, None keeps the whole item
+    if fields is None or not isinstance(item, dict):
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+def iter_array(chunks, fields=None):
+    """
+    Decodes a JSON array from an iterable of byte chunks and yields its items one
+    at a time, projected on fields. Only the undecoded tail of the body and the
+    item being decoded are held in memory, never the whole array.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    finished = False
+    # Like json.loads, the array must be well formed, with exactly one comma between
+    # items and nothing but whitespace after it
+    state = _OPEN
+
+    def more():
+        nonlocal buffer, position, finished
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+            buffer = buffer[position:] + utf8.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + utf8.decode(chunk)
+        position = 0
+
+    while True:
+        while position < len(buffer) and buffer[position] in _whitespace:
+            position += 1
+        if position == len(buffer):
+            if finished:
+                if state == _CLOSED:
+                    return
+                raise ValueError("Unexpected end of JSON array")
+            more()
+            continue
+
+        character = buffer[position]
+        if state == _OPEN:
+            if character != "[":
+                raise ValueError(f"Expected a JSON array, found '{character}'")
+            state = _FIRST
+            position += 1
+            continue
+        if state == _CLOSED:
+            raise ValueError(f"Unexpected data after JSON array, found '{character}'")
+        if state == _SEPARATOR:
+            if character not in ",]":
+                raise ValueError(f"Expected ',' or ']' after array item, found '{character}'")
+            state = _ITEM if character == "," else _CLOSED
+            position += 1
+            continue
+        if character == "]" and state == _FIRST:
+            state = _CLOSED
+            position += 1
+            continue
+        if character in ",]":
+            raise ValueError(f"Expected an array item, found '{character}'")
+
+        try:
+            item, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The item continues in the next chunk, unless the body has ended
+            if finished:
+                raise
+            more()
+            continue
+        following = end
+        while following < len(buffer) and buffer[following] in _whitespace:
+            following += 1
+        if (following == len(buffer) or buffer[following] not in ",]") and not finished:
+            # A number cut by the end of the chunk decodes too early, only an item
+            # followed by a separator is known to be complete
+            more()
+            continue
+        position = end
+        state = _SEPARATOR
+        yield project(item, fields)
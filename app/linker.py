@@ -0,0 +1,81 @@
+import aria.ops.adapter_logging as logging
+import threading
+from aria.ops.object import Object
+
+logger = logging.getLogger(__name__)
+
+PARENT = "parent"
+CHILD = "child"
+
+class ObjectIndex:
+    """
+    Objects of every kind registered by id, together with the relationships the
+    collectors declared between them. Relationships are recorded by the id of the
+    related object and resolved with dictionary lookups in a single pass by link()
+    once every collector has finished. Once frozen, the objects and relationships
+    of collectors abandoned at their deadline are no longer recorded.
+    """
+    def __init__(self):
+        self.objects = {}
+        self.relationships = []
+        self.frozen = False
+        self.lock = threading.Lock()
+
+    def register(self, obj: Object):
+        with self.lock:
+            if not self.frozen:
+                self.objects.setdefault(obj.object_type(), {})[obj.id] = obj
+
+    def freeze(self):
+        with self.lock:
+            self.frozen = True
+
+    def all_objects(self):
+        with self.lock:
+            return [obj for objects in self.objects.values() for obj in objects.values()]
+
+    def get(self, kind, id):
+        return self.objects.get(kind, {}).get(id)
+
+    def all(self, kind):
+        return list(self.objects.get(kind, {}).values())
+
+    def names(self, kind):
+        return {id: obj.name for id, obj in self.objects.get(kind, {}).items()}
+
+    def add_parent(self, obj: Object, kind, id):
+        if id:
+            with self.lock:
+                if not self.frozen:
+                    self.relationships.append((obj, PARENT, kind, id))
+
+    def add_child(self, obj: Object, kind, id):
+        if id:
+            with self.lock:
+                if not self.frozen:
+                    self.relationships.append((obj, CHILD, kind, id))
+
+    def relationships_of(self, objects):
+        objects = {id(obj) for obj in objects}
+        with self.lock:
+            return [relationship for relationship in self.relationships if id(relationship[0]) in objects]
+
+    def link(self):
+        linked = 0
+        unresolved = 0
+        with self.lock:
+            relationships = self.relationships
+            self.relationships = []
+        for obj, relation, kind, id in relationships:
+            other = self.get(kind, id)
+            if other is None or self.get(obj.object_type(), obj.id) is not obj:
+                # An object that was never registered is not emitted either
+                unresolved += 1
+                continue
+            if relation == PARENT:
+                obj.add_parent(other)
+            else:
+                obj.add_child(other)
+            linked += 1
+        logger.info(f"Linked {linked} relationships, {unresolved} unresolved")
+        return linked
@@ -8,9 +8,8 @@ from aria.ops.data import Metric
 from aria.ops.data import Property
 from aria.ops.object import Identifier
 from aria.ops.object import Key
-from RDSFarms import RDSFarm
-from globalApplicationPools import globalApplicationPool
 
+from linker import ObjectIndex
 from restcall import RestClient
 
 logger = logging.getLogger(__name__)
@@ -28,39 +27,22 @@ class localApplicationPool(Object):
             )
         )
 
-def get_local_application_pools(host, port, token, page, RDSFarms: List[RDSFarm], globalApplicationPools: List[globalApplicationPool]) -> List[localApplicationPool]:
+def get_local_application_pools(client: RestClient, index: ObjectIndex) -> List[localApplicationPool]:
         localApplicationPools = []
-        size = 1000
-        base_url = "https://" + str(host) + ":" + str(port)
-        headers = {
-            'Authorization': 'Bearer ' + token,
-        }
-        client = RestClient(base_url)
-        # Make a GET request to the device endpoint
-        queryString = '/rest/inventory/v3/application-pools?size=' + str(size) + '&page=' + str(page)
-        status_code, response_data = client.get(queryString, headers)
-        if status_code == 200:
-            for obj in response_data:
-                logger.info("RDS Pool ID:" + obj["id"])
-                logger.info("RDS Pool:" + obj["name"])
-                # creating object and adding it to the result set
-                new_pool = localApplicationPool(obj["name"], obj["id"])
-                new_pool.with_property("id", obj["id"])
-                new_pool.with_metric("enabled", obj["enabled"])
-                if "farm_id" in obj:
-                    new_pool.with_property("farm_id", obj["farm_id"])
-                    for RDSFarm in RDSFarms:
-                        if RDSFarm.id == obj["farm_id"]:
-                            new_pool.add_child(RDSFarm)
-                if "global_application_entitlement_id" in obj:
-                    new_pool.with_property("global_pool_id", obj["global_application_entitlement_id"])
-                    for globalApplicationPool in globalApplicationPools:
-                        if globalApplicationPool.id == obj["global_application_entitlement_id"]:
-                            new_pool.add_parent(globalApplicationPool)
-                localApplicationPools.append(new_pool)
-            if len(response_data) == size:
-                get_local_application_pools(host, port, token, page +1, RDSFarms, globalApplicationPools)
-        else:
-            logger.error("Error:", status_code)
+        for obj in client.paginate('/rest/inventory/v3/application-pools'):
+            logger.info("RDS Pool ID:" + obj["id"])
+            logger.info("RDS Pool:" + obj["name"])
+            # creating object and adding it to the result set
+            new_pool = localApplicationPool(obj["name"], obj["id"])
+            new_pool.with_property("id", obj["id"])
+            new_pool.with_metric("enabled", obj["enabled"])
+            if "farm_id" in obj:
+                new_pool.with_property("farm_id", obj["farm_id"])
+                index.add_child(new_pool, "RDSFarm", obj["farm_id"])
+            if "global_application_entitlement_id" in obj:
+                new_pool.with_property("global_pool_id", obj["global_application_entitlement_id"])
+                index.add_parent(new_pool, "globalApplicationPool", obj["global_application_entitlement_id"])
+            index.register(new_pool)
+            localApplicationPools.append(new_pool)
 
         return localApplicationPools
\ No newline at end of file
@@ -8,8 +8,8 @@ from aria.ops.data import Metric
 from aria.ops.data import Property
 from aria.ops.object import Identifier
 from aria.ops.object import Key
-from globalDesktopPools import globalDesktopPool
 
+from linker import ObjectIndex
 from restcall import RestClient
 
 logger = logging.getLogger(__name__)
@@ -27,34 +27,19 @@ class localDesktopPool(Object):
             )
         )
 
-def get_local_desktop_pools(host, port, token, page, globalDesktopPools: List[globalDesktopPool]) -> List[localDesktopPool]:
+def get_local_desktop_pools(client: RestClient, index: ObjectIndex) -> List[localDesktopPool]:
         localDesktopPools = []
-        base_url = "https://" + str(host) + ":" + str(port)
-        headers = {
-            'Authorization': 'Bearer ' + token,
-        }
-        size = 1000
-        client = RestClient(base_url)
-        # Make a GET request to the device endpoint
-        queryString = '/rest/inventory/v6/desktop-pools?size=' + str(size) + '&page=' + str(page)
-        status_code, response_data = client.get(queryString, headers)
-        if status_code == 200:
-            for obj in response_data:
-                logger.info("Pool ID:" + obj["id"])
-                logger.info("Pool Name:" + obj["name"])
-                # creating object and adding it to the result set
-                new_localDesktopPool = localDesktopPool(obj["name"], obj["id"])
-                new_localDesktopPool.with_property("id", obj["id"])
-                new_localDesktopPool.with_metric("enabled", obj["enabled"])
-                if "global_desktop_entitlement_id" in obj:
-                    new_localDesktopPool.with_property("global_pool_id", obj["global_desktop_entitlement_id"])
-                    for globalPool in globalDesktopPools:
-                        if globalPool.id == obj["global_desktop_entitlement_id"]:
-                            new_localDesktopPool.add_parent(globalPool)
-                localDesktopPools.append(new_localDesktopPool)
-            if len(response_data) == size:
-                get_local_desktop_pools(host, port, token, page +1, globalDesktopPools)
-        else:
-            logger.error("Error:", status_code)
+        for obj in client.paginate('/rest/inventory/v6/desktop-pools'):
+            logger.info("Pool ID:" + obj["id"])
+            logger.info("Pool Name:" + obj["name"])
+            # creating object and adding it to the result set
+            new_localDesktopPool = localDesktopPool(obj["name"], obj["id"])
+            new_localDesktopPool.with_property("id", obj["id"])
+            new_localDesktopPool.with_metric("enabled", obj["enabled"])
+            if "global_desktop_entitlement_id" in obj:
+                new_localDesktopPool.with_property("global_pool_id", obj["global_desktop_entitlement_id"])
+                index.add_parent(new_localDesktopPool, "globalDesktopPool", obj["global_desktop_entitlement_id"])
+            index.register(new_localDesktopPool)
+            localDesktopPools.append(new_localDesktopPool)
 
         return localDesktopPools
\ No newline at end of file
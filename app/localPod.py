@@ -2,15 +2,14 @@ import aria.ops.adapter_logging as logging
 import constants
 import json
 from constants import ADAPTER_KIND
-from globalDesktopPools import globalDesktopPool
 from typing import List
 from aria.ops.object import Object
 from aria.ops.data import Metric
 from aria.ops.data import Property
 from aria.ops.object import Identifier
 from aria.ops.object import Key
-from globalApplicationPools import globalApplicationPool
 
+from linker import ObjectIndex
 from restcall import RestClient
 
 logger = logging.getLogger(__name__)
@@ -28,16 +27,11 @@ class localPod(Object):
             )
         )
 
-def get_local_pod(host, port, token, globalDesktopPools: List[globalDesktopPool], globalApplicationPools: List[globalApplicationPool]) -> List[localPod]:
-        base_url = "https://" + str(host) + ":" + str(port)
-        headers = {
-            'Authorization': 'Bearer ' + token,
-        }
+def get_local_pod(client: RestClient, index: ObjectIndex) -> List[localPod]:
         localPods = []
-        client = RestClient(base_url)
         # Make a GET request to the device endpoint
         queryString = '/rest/federation/v1/pods'
-        status_code, response_data = client.get(queryString, headers)
+        status_code, response_data = client.get(queryString)
         if status_code == 200:
             for obj in response_data:
                 if obj["local_pod"] == True:
@@ -48,16 +42,13 @@ def get_local_pod(host, port, token, globalDesktopPools: List[globalDesktopPool]
                     new_localPod.with_property("id", obj["id"])
                     if "active_global_desktop_entitlements" in obj:
                         for poolId in obj["active_global_desktop_entitlements"]:
-                            for globalPool in globalDesktopPools:
-                                if poolId == globalPool.id:
-                                    new_localPod.add_child(globalPool)
+                            index.add_child(new_localPod, "globalDesktopPool", poolId)
                     if "active_global_application_entitlements" in obj:
                         for poolId in obj["active_global_application_entitlements"]:
-                            for globalPool in globalApplicationPools:
-                                if poolId == globalPool.id:
-                                    new_localPod.add_child(globalPool)
+                            index.add_child(new_localPod, "globalApplicationPool", poolId)
+                    index.register(new_localPod)
                     localPods.append(new_localPod)
         else:
-            logger.error("Error:", status_code)
+            logger.error(f"Error fetching {queryString}: {status_code}")
 
         return localPods
\ No newline at end of file
@@ -2,6 +2,7 @@ import aria.ops.adapter_logging as logging
 import constants
 import json
 import math
+import time
 from constants import ADAPTER_KIND
 from aria.ops.object import Object
 from typing import List
@@ -9,10 +10,10 @@ from aria.ops.data import Metric
 from aria.ops.data import Property
 from aria.ops.object import Identifier
 from aria.ops.object import Key
-from localDesktopPools import localDesktopPool
-from RDSFarms import RDSFarm
-from RDSHosts import RDSHost
+from resolver import SessionResolver
+from cache import PersistentCache
 
+from linker import ObjectIndex
 from restcall import RestClient
 
 logger = logging.getLogger(__name__)
@@ -30,59 +31,34 @@ class localSession(Object):
             )
         )
 
-def get_local_sessions(host, port, token, page, localDesktopPools: List[localDesktopPool], RDSFarms: List[RDSFarm], RDSHosts: List[RDSHost]) -> List[localSession]:
+def get_local_sessions(client: RestClient, index: ObjectIndex, cache: PersistentCache, pending: list) -> List[localSession]:
+        # Sessions registered without a logon time are appended to pending, as
+        # (id, session), for get_logon_timings
         localSessions = []
-        size = 1000 
-        base_url = "https://" + str(host) + ":" + str(port)
-        headers = {
-            'Authorization': 'Bearer ' + token,
-        }
-        client = RestClient(base_url)
-        # Make a GET request to the device endpoint
-        queryString = '/rest/inventory/v1/sessions?size=' + str(size) + '&page=' + str(page)
-        status_code, response_data = client.get(queryString, headers)
-        if status_code == 200:
+        resolver = SessionResolver(client, index, cache)
+        # Sessions of the previous collection, by id, as
+        # [state, host, protocol, loginName, machineName, logonTime, poolId, farmId]
+        previous = cache.get(SNAPSHOT_TYPE, client.base_url)
+        current = {}
+        # Page through the sessions, only new or changed sessions are resolved again
+        for response_data in client.pages('/rest/inventory/v1/sessions', fields=constants.SESSION_FIELDS):
+            changed = [obj for obj in response_data if reusable(previous, obj) is None]
+            resolver.prefetch(changed)
             for obj in response_data:
-                loginName = ''
-                poolName = ''
-                logonTime = 0
-                farmName = ''
-                machineName = ''
-                rdsName = ''
+                known = reusable(previous, obj)
+                if known:
+                    loginName, machineName, logonTime = known[3], known[4], known[5]
+                else:
+                    logonTime = resolver.logon_time(obj["id"])
+                    loginName = resolver.login_name(obj["user_id"])
+                    machineName = resolver.machine_name(obj.get("machine_id"))
+                poolName = resolver.pool_name(obj.get("desktop_pool_id"))
+                farmName = resolver.farm_name(obj.get("farm_id"))
+                rdsName = resolver.rds_name(obj.get("rds_server_id"))
+                current[obj["id"]] = session_state(obj) + [loginName, machineName, logonTime,
+                                                            obj.get("desktop_pool_id"), obj.get("farm_id")]
 
-                queryString = '/rest/external/v1/ad-users-or-groups/' + obj["user_id"]
-                status_code, response_data2 = client.get(queryString, headers)
-                if status_code == 200:
-                    loginName = response_data2['login_name']
-
-                if "desktop_pool_id" in obj and obj["desktop_pool_id"]:
-                    queryString = '/rest/inventory/v1/desktop-pools/' + obj["desktop_pool_id"]
-                    status_code, response_data3 = client.get(queryString, headers)
-                    if status_code == 200:
-                        poolName = response_data3['name']
-                    # creating object and adding it to the result set
-
-                if "farm_id" in obj and obj["farm_id"]:
-                    queryString = '/rest/inventory/v1/farms/' + obj["farm_id"]
-                    status_code, response_data4 = client.get(queryString, headers)
-                    if status_code == 200:
-                        farmName = response_data4['name']
-                    # creating object and adding it to the result set    
-
-                if "machine_id" in obj and obj["machine_id"]:
-                    queryString = '/rest/inventory/v1/machines/' + obj["machine_id"]
-                    status_code, response_data5 = client.get(queryString, headers)
-                    if status_code == 200:
-                        machineName = response_data5['name']
-                    # creating object and adding it to the result set       
-
-                if "rds_server_id" in obj and obj["rds_server_id"]:
-                    queryString = '/rest/inventory/v1/rds_server_id/' + obj["rds_server_id"]
-                    status_code, response_data6 = client.get(queryString, headers)
-                    if status_code == 200:
-                        rdsName = response_data6['name']
-                    # creating object and adding it to the result set           
-                
+                sessionName = loginName
                 if poolName:
                     sessionName = loginName + ":vdi:" + poolName
                 if rdsName:
@@ -90,27 +66,9 @@ def get_local_sessions(host, port, token, page, localDesktopPools: List[localDes
                 new_localSession = localSession(sessionName, obj["id"])
                 new_localSession.with_property("id", obj["id"])
 
-                if "desktop_pool_id" in obj and obj["desktop_pool_id"]:
-                    for localPool in localDesktopPools:
-                        if localPool.id == obj["desktop_pool_id"]:
-                            new_localSession.add_parent(localPool)
-
-                if "rds_server_id" in obj and obj["rds_server_id"]:
-                    for RDSHost in RDSHosts:
-                        if RDSHost.id == obj["rds_server_id"]:
-                            new_localSession.add_parent(RDSHost)   
-
-                if "farm_id" in obj and obj["farm_id"]:
-                    for RDSFarm in RDSFarms:
-                        if RDSFarm.id == obj["farm_id"]:
-                            new_localSession.add_parent(RDSFarm)                   
-                
-                queryString = '/rest/helpdesk/v1/logon-timing/logon-segment?session_id=' + obj["id"]
-                status_code, response_data7 = client.get(queryString, headers)
-                if status_code == 200:
-                    segment = json.loads(response_data7['logon_segment_data'])
-                    if 'v1' in segment:
-                        logonTime = math.ceil(segment['v1']['d']/1000)         
+                index.add_parent(new_localSession, "localDesktopPool", obj.get("desktop_pool_id"))
+                index.add_parent(new_localSession, "RDSHost", obj.get("rds_server_id"))
+                index.add_parent(new_localSession, "RDSFarm", obj.get("farm_id"))
                 
                 new_localSession.with_property("state", obj["session_state"])
                 new_localSession.with_property("type", obj["session_type"])
@@ -119,15 +77,82 @@ def get_local_sessions(host, port, token, page, localDesktopPools: List[localDes
                     new_localSession.with_property("protocol", obj["session_protocol"])
                 new_localSession.with_property("pool", poolName)
                 new_localSession.with_property("name",loginName)
-                new_localSession.with_metric("LogonTime", logonTime)
+                if logonTime:
+                    new_localSession.with_metric("LogonTime", logonTime)
                 new_localSession.with_property("farmName", farmName)
                 new_localSession.with_property("machineName", machineName)
                 new_localSession.with_property("rdsName", rdsName)
+                index.register(new_localSession)
                 localSessions.append(new_localSession)
-            if len(response_data) == size:
-                get_local_sessions(host, port, token, page +1, localDesktopPools, RDSFarms, RDSHosts)
-        else:
-            logger.error("Error:", status_code)
+                if not logonTime:
+                    pending.append((obj["id"], new_localSession))
 
+        # The snapshot, the churn and the retained logon timings describe every session
+        # of the pod. They are only updated once the last page was read, a failed page
+        # raises out of the walk above, and not by a walk that ended after the collector
+        # was abandoned at the cycle deadline, whose churn the next cycle reports instead
+        if client.deadline is not None and time.monotonic() >= client.deadline:
+            logger.warning("Session walk finished after the cycle deadline, keeping the previous snapshot")
+            return localSessions
+        if previous is not None:
+            add_session_churn(index, previous, current)
+        cache.put(SNAPSHOT_TYPE, client.base_url, current)
+        resolver.retain(list(current))
         return localSessions
 
+def get_logon_timings(client: RestClient, index: ObjectIndex, cache: PersistentCache, pending: list, budget=None) -> int:
+        # Logon durations of the sessions registered without one. They are fetched once the
+        # sessions are emitted and stop at a share of this collector's own budget, so a slow
+        # helpdesk API only costs the LogonTime metric of the sessions it did not answer for
+        expiry = time.monotonic() + budget if budget is not None else None
+        if client.deadline is not None:
+            expiry = min(expiry, client.deadline) if expiry is not None else client.deadline
+        deadline = None
+        if expiry is not None:
+            deadline = time.monotonic() + (expiry - time.monotonic()) * constants.LOGON_TIMING_BUDGET_RATIO
+        sessions = dict(list(pending))
+        if not sessions:
+            return 0
+        resolver = SessionResolver(client, index, cache)
+        answered = resolver.fetch_logon_times(list(sessions), deadline)
+        for sessionId, logonTime in answered.items():
+            # Sessions still logging on report 0, like before their timing was known
+            sessions[sessionId].with_metric("LogonTime", logonTime or 0)
+        if len(answered) < len(sessions):
+            raise TimeoutError(f"{len(sessions) - len(answered)} of {len(sessions)} logon timings not received, "
+                               "their sessions are reported without LogonTime")
+        return len(answered)
+
+SNAPSHOT_TYPE = "sessionSnapshot"
+
+def session_state(obj):
+    return [obj["session_state"], obj.get("rds_server_id") or obj.get("machine_id"), obj.get("session_protocol")]
+
+def reusable(previous, obj):
+    # The previous record of a session whose state, host and protocol did not
+    # change, as long as its names and logon time were resolved. A name left empty
+    # by a failed lookup is looked up again instead of sticking to the session
+    known = previous.get(obj["id"]) if previous else None
+    if known and known[:3] == session_state(obj) and known[3] and known[5] \
+            and (known[4] or not obj.get("machine_id")):
+        return known
+    return None
+
+def add_session_churn(index: ObjectIndex, previous, current):
+        # Sessions started and ended since the previous collection, per pool and farm
+        churn = {}
+        for sessionId, record in current.items():
+            for kind, id in (("localDesktopPool", record[6]), ("RDSFarm", record[7])):
+                counts = churn.setdefault((kind, id), [0, 0])
+                if sessionId not in previous:
+                    counts[0] += 1
+        for sessionId, record in previous.items():
+            if sessionId not in current:
+                for kind, id in (("localDesktopPool", record[6]), ("RDSFarm", record[7])):
+                    churn.setdefault((kind, id), [0, 0])[1] += 1
+
+        for (kind, id), (started, ended) in churn.items():
+            obj = index.get(kind, id)
+            if obj is not None:
+                obj.with_metric("sessions_started", started)
+                obj.with_metric("sessions_ended", ended)
@@ -0,0 +1,84 @@
+import aria.ops.adapter_logging as logging
+import constants
+import psutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+class MemoryGovernor:
+    """
+    Samples the RSS of the adapter process during a collection and scales the
+    collection down before the container memory limit is reached. Above the
+    pressure threshold the clients switch to streaming decode without prefetch
+    and smaller pages, above the critical threshold collectors run one at a
+    time. Each step is logged once with the collectors running at that moment.
+    """
+    def __init__(self, limit_mb, clients, scheduler=None, interval=constants.MEMORY_SAMPLE_INTERVAL):
+        self.limit = limit_mb * 1024 * 1024
+        self.clients = list(clients)
+        self.scheduler = scheduler
+        self.interval = interval
+        self.process = psutil.Process()
+        self.level = 0
+        self.peak = 0
+        self.peak_stage = ""
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.sample()
+        self.thread = threading.Thread(target=self._run, name="memoryGovernor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.sample()
+        logger.info(f"Peak RSS {self.peak // 1048576} MB of {self.limit // 1048576} MB "
+                    f"during {self.peak_stage or 'setup'}")
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def stage(self):
+        if self.scheduler is None:
+            return ""
+        return ", ".join(sorted(self.scheduler.running))
+
+    def sample(self):
+        try:
+            rss = self.process.memory_info().rss
+        except psutil.Error as e:
+            logger.warning(f"Unable to read the adapter memory usage: {e}")
+            return
+        if rss > self.peak:
+            self.peak = rss
+            self.peak_stage = self.stage()
+        if self.limit <= 0:
+            return
+
+        usage = rss / self.limit
+        if usage >= constants.MEMORY_CRITICAL_THRESHOLD and self.level < 2:
+            self.level = 2
+            logger.warning(f"Memory critical at {rss // 1048576} MB of {self.limit // 1048576} MB "
+                           f"during {self.stage() or 'setup'}, running one collector at a time")
+            self._reduce_clients()
+            if self.scheduler is not None:
+                self.scheduler.max_running = 1
+        elif usage >= constants.MEMORY_PRESSURE_THRESHOLD and self.level < 1:
+            self.level = 1
+            logger.warning(f"Memory pressure at {rss // 1048576} MB of {self.limit // 1048576} MB "
+                           f"during {self.stage() or 'setup'}, switching to streaming decode")
+            self._reduce_clients()
+            if self.scheduler is not None:
+                self.scheduler.max_running = max(self.scheduler.max_running // 2, 1)
+
+    def _reduce_clients(self):
+        # Pagination already in progress keeps its page size, the smaller pages
+        # apply to the next endpoint a collector pages through
+        for client in self.clients:
+            client.streaming = True
+            client.prefetch = False
+            client.page_size = max(client.page_size // 2, constants.MIN_PAGE_SIZE)
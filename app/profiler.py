@@ -0,0 +1,119 @@
+import aria.ops.adapter_logging as logging
+import constants
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+CPU = "cpu"
+MEMORY = "memory"
+CPU_AND_MEMORY = "cpu_and_memory"
+MODES = [OFF, CPU, MEMORY, CPU_AND_MEMORY]
+
+class Profiler:
+    """
+    Profiles one adapter run. With CPU profiling every thread started during the
+    run gets its own cProfile profile, they are merged into <method>.prof. With
+    memory profiling tracemalloc records the allocations and the top allocating
+    lines are written to <method>_allocations.txt. Both files are written next to
+    adapter.log and rotated like it, keeping the last few runs.
+    """
+    def __init__(self, mode, method, directory=None):
+        self.cpu = mode in (CPU, CPU_AND_MEMORY)
+        self.memory = mode in (MEMORY, CPU_AND_MEMORY)
+        self.method = method
+        self.directory = directory or log_directory()
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if self.memory:
+            tracemalloc.start(constants.PROFILE_TRACEBACK_DEPTH)
+        if self.cpu:
+            threading.setprofile(self._profile_thread)
+            self._profile_thread()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            # Allocations first, so the profile data is not reported as allocated
+            if self.cpu:
+                threading.setprofile(None)
+            if self.memory:
+                self._write_allocations()
+            if self.cpu:
+                self._write_cpu_profile()
+        except Exception as e:
+            # Profiling must never fail the run it observes
+            logger.warning(f"Unable to write the profile of {self.method}: {e}")
+        finally:
+            if self.memory:
+                tracemalloc.stop()
+        return False
+
+    def _profile_thread(self, *args):
+        # Called once in each new thread, replaces itself with a profile of that thread
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def _write_cpu_profile(self):
+        with self.lock:
+            profiles = list(self.profiles)
+        for profile in profiles:
+            profile.disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        path = rotate(os.path.join(self.directory, self.method + ".prof"))
+        stats.dump_stats(path)
+
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats("cumulative").print_stats(constants.PROFILE_TOP_N)
+        logger.info(f"CPU profile of {self.method} over {len(profiles)} threads written to {path}")
+        logger.debug(summary.getvalue())
+
+    def _write_allocations(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, pstats.__file__),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        path = rotate(os.path.join(self.directory, self.method + "_allocations.txt"))
+        with open(path, "w") as file:
+            file.write(f"{self.method} run of {time.perf_counter() - self.start:.1f}s\n")
+            file.write(f"Traced memory: {current / 1048576:.1f} MB at the end, {peak / 1048576:.1f} MB peak\n\n")
+            file.write(f"Top {constants.PROFILE_TOP_N} lines by memory still allocated at the end:\n")
+            for statistic in snapshot.statistics("lineno")[:constants.PROFILE_TOP_N]:
+                file.write(f"{statistic}\n")
+            file.write(f"\nTop {constants.PROFILE_TOP_N} call stacks:\n")
+            for statistic in snapshot.statistics("traceback")[:constants.PROFILE_TOP_N]:
+                file.write(f"\n{statistic.size / 1024:.1f} KiB in {statistic.count} blocks\n")
+                for line in statistic.traceback.format():
+                    file.write(line + "\n")
+        logger.info(f"Allocation report of {self.method} written to {path}, peak {peak / 1048576:.1f} MB")
+
+def log_directory():
+    if logging.log_handler is not None:
+        return os.path.dirname(logging.log_handler.baseFilename)
+    return os.getcwd()
+
+def rotate(path, count=constants.PROFILE_FILE_COUNT):
+    # Like the adapter.log rotation, path.1 is the previous run and path.<count> the oldest kept
+    for number in range(count - 1, 0, -1):
+        if os.path.exists(f"{path}.{number}"):
+            os.replace(f"{path}.{number}", f"{path}.{number + 1}")
+    if os.path.exists(path):
+        os.replace(path, path + ".1")
+    return path
@@ -0,0 +1,67 @@
+import aria.ops.adapter_logging as logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveRateLimiter:
+    """
+    Caps the requests in flight and the requests per second sent to one
+    connection server. The concurrency limit follows AIMD: it grows by about one
+    for every window of requests answered within the target latency, and is
+    halved when a response is slower than the target or the server answers 429
+    or 503. It never goes below one request or above max_concurrency.
+    """
+    def __init__(self, max_concurrency, max_rate, target_latency):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.next_slot = 0.0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        # Returns False when no request could start within timeout seconds
+        delay = 0
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                return False
+            self.in_flight += 1
+            if self.max_rate > 0:
+                # Requests get evenly spaced start slots, at most max_rate per second
+                now = time.monotonic()
+                slot = max(now, self.next_slot)
+                self.next_slot = slot + 1 / self.max_rate
+                delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def cancel(self):
+        # Gives back a slot that was acquired but not used for a request
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def release(self, latency, status_code=None):
+        with self.condition:
+            self.in_flight -= 1
+            if status_code is None or status_code in (429, 503) or latency > self.target_latency:
+                self._decrease(status_code, latency)
+            elif status_code < 400:
+                self.limit = min(self.limit + 1 / self.limit, float(self.max_concurrency))
+            self.condition.notify_all()
+
+    def _decrease(self, status_code, latency):
+        # Responses that were already in flight when the limit was cut report the
+        # same overload, so the limit is halved at most once per target latency
+        now = time.monotonic()
+        if now - self.last_decrease < self.target_latency:
+            return
+        self.last_decrease = now
+        limit = max(self.limit / 2, 1.0)
+        if int(limit) != int(self.limit):
+            logger.info(f"Lowering concurrent requests to {int(limit)} (status {status_code}, {latency:.2f}s)")
+        self.limit = limit
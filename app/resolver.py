@@ -0,0 +1,149 @@
+import aria.ops.adapter_logging as logging
+import constants
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from urllib.parse import quote
+
+from cache import PersistentCache
+from linker import ObjectIndex
+from restcall import RestClient
+
+logger = logging.getLogger(__name__)
+
+class SessionResolver:
+    """
+    Resolves the ids referenced by sessions to display names. Pools, farms and RDS
+    hosts are looked up in the collections already loaded by collect(), machines
+    and AD users come from the persistent cache or are fetched in bulk per page of
+    sessions instead of one by one. Logon durations never change once known, they
+    are cached per session. Those not cached yet are fetched by fetch_logon_times,
+    on a bounded worker pool, after the sessions were registered.
+    """
+    def __init__(self, client: RestClient, index: ObjectIndex, cache: PersistentCache):
+        self.client = client
+        self.cache = cache
+        self.poolNames = index.names("localDesktopPool")
+        self.farmNames = index.names("RDSFarm")
+        self.rdsNames = index.names("RDSHost")
+        self.machineNames = {}
+        self.loginNames = {}
+        self.logonTimes = {}
+        self.logonTimingType = "logonTiming@" + client.base_url
+
+    def prefetch(self, sessions):
+        machineIds = set()
+        userIds = set()
+        for obj in sessions:
+            if obj.get("machine_id") and obj["machine_id"] not in self.machineNames:
+                machineIds.add(obj["machine_id"])
+            if obj.get("user_id") and obj["user_id"] not in self.loginNames:
+                userIds.add(obj["user_id"])
+
+        self.machineNames.update(self._fetch_names("machine", '/rest/inventory/v1/machines', machineIds, 'name'))
+        self.loginNames.update(self._fetch_names("adUser", '/rest/external/v1/ad-users-or-groups', userIds, 'login_name'))
+        self.logonTimes.update(self.cache.get_many(self.logonTimingType, [obj["id"] for obj in sessions]))
+
+    def retain(self, sessionIds):
+        # Logon timings of sessions that are gone are never needed again
+        self.cache.retain(self.logonTimingType, sessionIds)
+
+    def login_name(self, userId):
+        return self.loginNames.get(userId, '')
+
+    def pool_name(self, poolId):
+        return self.poolNames.get(poolId, '')
+
+    def farm_name(self, farmId):
+        return self.farmNames.get(farmId, '')
+
+    def machine_name(self, machineId):
+        return self.machineNames.get(machineId, '')
+
+    def rds_name(self, rdsId):
+        return self.rdsNames.get(rdsId, '')
+
+    def logon_time(self, sessionId):
+        return self.logonTimes.get(sessionId, 0)
+
+    def fetch_logon_times(self, sessionIds, deadline=None):
+        # Returns the answers received before deadline, None for sessions still logging on.
+        # Requests still running at the deadline are abandoned, their sessions are asked
+        # for again next time
+        answered = {}
+        tracer = self.client.tracer
+        executor = ThreadPoolExecutor(max_workers=constants.LOGON_TIMING_WORKERS)
+        with tracer.span("logon_timings", sessions=len(sessionIds)) as span:
+            def fetch(sessionId):
+                with tracer.attach(span):
+                    return self._fetch_logon_time(sessionId)
+
+            futures = {executor.submit(fetch, id): id for id in sessionIds}
+            try:
+                done, _ = wait(futures, timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+            for future in done:
+                if future.exception() is None:
+                    answered[futures[future]] = future.result()
+                else:
+                    logger.warning(f"Logon timing of session {futures[future]} failed: {future.exception()!r}")
+            span.set("answered", len(answered))
+        # Sessions still logging on have no timing yet and are asked for again next time
+        fetched = {id: logonTime for id, logonTime in answered.items() if logonTime is not None}
+        self.cache.put_many(self.logonTimingType, fetched)
+        self.logonTimes.update(fetched)
+        return answered
+
+    def _fetch_logon_time(self, sessionId):
+        queryString = '/rest/helpdesk/v1/logon-timing/logon-segment?session_id=' + sessionId
+        status_code, response_data = self.client.get(queryString)
+        if status_code == 200 and response_data and response_data.get('logon_segment_data'):
+            segment = json.loads(response_data['logon_segment_data'])
+            if 'v1' in segment:
+                return math.ceil(segment['v1']['d']/1000)
+        return None
+
+    def _fetch_names(self, type, endpoint, ids, field):
+        names = self.cache.get_many(type, ids)
+        missing = sorted(set(ids) - set(names))
+        fetched = {}
+        chunkSize = constants.FILTER_CHUNK_SIZE
+        for start in range(0, len(missing), chunkSize):
+            chunk = missing[start:start + chunkSize]
+            if not self._fetch_chunk(endpoint, chunk, field, fetched):
+                # The bulk filter was rejected, fall back to single lookups for this chunk
+                for id in chunk:
+                    if not self.client.available(endpoint):
+                        break
+                    status_code, response_data = self.client.get(endpoint + '/' + id)
+                    if status_code == 200:
+                        fetched[id] = response_data.get(field, '')
+                    else:
+                        logger.error(f"Error resolving {endpoint}/{id}: {status_code}")
+
+        # Ids the server no longer knows must not be served from an expired entry later
+        for id in missing:
+            if id not in fetched:
+                self.cache.invalidate(type, id)
+        self.cache.put_many(type, fetched)
+        names.update(fetched)
+        return names
+
+    def _fetch_chunk(self, endpoint, ids, field, names):
+        size = 1000
+        page = 1
+        filter = quote(json.dumps({"type": "In", "name": "id", "value": ids}))
+        while True:
+            queryString = endpoint + '?filter=' + filter + '&size=' + str(size) + '&page=' + str(page)
+            status_code, response_data = self.client.get(queryString)
+            if status_code != 200 or response_data is None:
+                logger.warning(f"Bulk lookup on {endpoint} failed: {status_code}")
+                return False
+            for obj in response_data:
+                names[obj["id"]] = obj.get(field, '')
+            if len(response_data) < size:
+                return True
+            page += 1
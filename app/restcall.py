@@ -1,21 +1,105 @@
 import requests,urllib3
+import copy
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+import aria.ops.adapter_logging as logging
+import constants
+from circuitBreaker import CircuitBreaker
+from jsonStream import iter_array
+from jsonStream import project
+from rateLimiter import AdaptiveRateLimiter
+from selfMonitoring import RequestStats
+from selfMonitoring import endpoint_family
+from serverPool import ServerPool
+from tracer import CLIENT
+from tracer import NULL_TRACER
+from validatorCache import ValidatorCache
+
+logger = logging.getLogger(__name__)
+
+class DeadlineExceeded(Exception):
+    pass
+
+class PageError(Exception):
+    pass
+
 class RestClient:
-    def __init__(self, base_url):
+    def __init__(self, base_url, pool_size=constants.HTTP_POOL_SIZE, stats: RequestStats = None, limiter: AdaptiveRateLimiter = None,
+                 max_retries=constants.DEFAULT_MAX_RETRIES, servers: ServerPool = None, timeout=constants.DEFAULT_REQUEST_TIMEOUT):
         self.base_url = base_url
+        # Further connection servers of the same pod that GETs are spread across,
+        # logins and token refreshes always go to base_url
+        self.servers = servers if servers is not None else ServerPool([base_url])
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker(base_url)
+        self.stats = stats if stats is not None else RequestStats()
+        self.limiter = limiter
+        if limiter:
+            pool_size = max(pool_size, limiter.max_concurrency)
 
-    def get(self, endpoint, headers):
-        url = f"{self.base_url}{endpoint}"
-        response = requests.get(url, headers=headers,verify=False)
+        # One keep-alive session shared by every collector, so connections to the
+        # connection server are opened once and reused for the whole collection
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        self.adapter = HTTPAdapter(pool_connections=len(self.servers.urls), pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.token = None
+        self.token_manager = None
+        # Decode paged responses while they are read instead of loading whole pages
+        self.streaming = False
+        self.prefetch = True
+        self.page_size = constants.PAGE_SIZE
+        # time.monotonic() after which no request is sent any more
+        self.deadline = None
+        # Seconds a request may wait for its answer, capped by the deadline
+        self.timeout = max(timeout, 1)
+        # TrafficRecorder capturing every request and response
+        self.recorder = None
+        self.tracer = NULL_TRACER
+        # Conditional GETs of slow-changing endpoints, enabled by setting its cache
+        self.validators = ValidatorCache()
+
+    def set_token(self, token):
+        self.token = token
+        self.session.headers['Authorization'] = 'Bearer ' + token
+
+    def authenticate(self, token_manager):
+        self.token_manager = token_manager
+        self.set_token(token_manager.token())
+
+    def get(self, endpoint, headers=None):
+        key = None
+        entry = None
+        if self.validators.applies(endpoint):
+            key = self.base_url + endpoint
+            conditional, entry = self.validators.conditional_headers(key)
+            headers = dict(headers or {}, **conditional)
+        response = self._get(endpoint, headers=headers)
+        if response is None:
+            return None, None
 
         # Get response status code
         status_code = response.status_code
 
+        if key is not None and status_code == 304 and entry:
+            # Unchanged since the cached answer
+            return 200, self.validators.not_modified(key, entry)
+
         # Check if response status is OK (200)
         if response.ok:
             # Parse JSON response body
             try:
+                if key is not None:
+                    return status_code, self.validators.update(key, response, entry)
                 json_data = response.json()
                 return status_code, json_data
             except ValueError:
@@ -24,9 +108,88 @@ class RestClient:
             # If response status is not OK, return None for JSON data
             return status_code, None
 
+    def get_items(self, endpoint, fields=None):
+        # Like get() for endpoints answering a JSON array, but the body is decoded
+        # while it is read and the items are yielded one at a time
+        response = self._get(endpoint, stream=True)
+        if response is None:
+            return None, None
+        if not response.ok:
+            response.close()
+            return response.status_code, None
+
+        def items():
+            with response:
+                yield from iter_array(response.iter_content(constants.STREAM_CHUNK_SIZE), fields)
+        return response.status_code, items()
+
+    def available(self, endpoint):
+        return self.breaker.allow(endpoint_family(endpoint))
+
+    def _get(self, endpoint, **kwargs):
+        # GETs are idempotent, connection errors and transient statuses are retried
+        # with jittered exponential backoff. Returns None while the circuit of the
+        # endpoint family is open. Every attempt may go to another connection server
+        family = endpoint_family(endpoint)
+        if not self.breaker.allow(family):
+            return None
+        attempt = 0
+        renewed = False
+        while True:
+            token = self.token
+            error = None
+            response = None
+            server = self.servers.pick()
+            start = time.perf_counter()
+            try:
+                response = self._send(self.session.get, endpoint, server + endpoint, verify=False, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                self.servers.report(
+                    server,
+                    time.perf_counter() - start if response is not None else None,
+                    error is not None or (response is not None and response.status_code in constants.RETRY_STATUS_CODES),
+                )
+
+            if response is not None and response.status_code == 401 and self.token_manager and not renewed:
+                # The token expired during the collection, retry once with a new one
+                response.close()
+                self.set_token(self.token_manager.renew(token))
+                renewed = True
+                continue
+            if response is not None and response.status_code not in constants.RETRY_STATUS_CODES:
+                self.breaker.record(family, True)
+                return response
+
+            if attempt >= self.max_retries or not self._backoff(attempt, response):
+                if self.breaker.record(family, False):
+                    self.stats.record_circuit_open(endpoint)
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            attempt += 1
+            self.stats.record_retry(endpoint)
+            logger.warning(f"Retrying {endpoint} ({attempt}/{self.max_retries}) after "
+                           f"{response.status_code if response is not None else repr(error)}")
+
+    def _backoff(self, attempt, response):
+        # Full jitter, or the delay asked for by a Retry-After header. Returns False
+        # when the collection deadline would pass before the next attempt
+        delay = random.uniform(0, min(constants.RETRY_BACKOFF * 2 ** attempt, constants.RETRY_BACKOFF_MAX))
+        retryAfter = response.headers.get("Retry-After") if response is not None else None
+        if retryAfter and retryAfter.isdigit():
+            delay = min(int(retryAfter), constants.RETRY_BACKOFF_MAX)
+        if self.deadline is not None and time.monotonic() + delay >= self.deadline:
+            return False
+        time.sleep(delay)
+        return True
+
     def post(self, endpoint, headers, payload):
         url = f"{self.base_url}{endpoint}"
-        response = requests.post(url, headers=headers, data=payload,verify=False)
+        response = self._send(self.session.post, endpoint, url, headers=headers, data=payload, verify=False)
 
         # Get response status code
         status_code = response.status_code
@@ -43,3 +206,163 @@ class RestClient:
             # If response status is not OK, return None for JSON data
             return status_code, "ERROR"
 
+    def _remaining(self, endpoint):
+        # Seconds a request may still take, so that no thread outlives the deadline,
+        # not even one of a collector abandoned by the scheduler
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Collection deadline reached before {endpoint}")
+        return min(self.timeout, remaining)
+
+    def _send(self, method, endpoint, url, **kwargs):
+        remaining = self._remaining(endpoint)
+        name = method.__name__.upper()
+        with self.tracer.span(name + " " + endpoint.split("?")[0], kind=CLIENT, endpoint=endpoint, server=url[:len(url) - len(endpoint)]) as span:
+            if self.limiter:
+                queued = time.perf_counter()
+                if not self.limiter.acquire(remaining):
+                    self._remaining(endpoint)
+                    raise requests.Timeout(f"No request slot for {endpoint} within {remaining:.1f}s")
+                span.set("queued_ms", round((time.perf_counter() - queued) * 1000, 3))
+                try:
+                    remaining = self._remaining(endpoint)
+                except DeadlineExceeded:
+                    self.limiter.cancel()
+                    raise
+            kwargs["timeout"] = (min(constants.CONNECT_TIMEOUT, remaining), remaining)
+            start = time.perf_counter()
+            status_code = None
+            try:
+                response = method(url, **kwargs)
+                status_code = response.status_code
+            except requests.RequestException as e:
+                self.stats.record(endpoint, time.perf_counter() - start, False, 0)
+                if self.recorder:
+                    self.recorder.record(self.base_url, name, url, kwargs, start, time.perf_counter() - start, error=e)
+                raise
+            finally:
+                if self.limiter:
+                    self.limiter.release(time.perf_counter() - start, status_code)
+            if self.recorder:
+                # Reads the whole body, a streamed response is then decoded from memory
+                self.recorder.record(self.base_url, name, url, kwargs, start, time.perf_counter() - start, response=response)
+            if kwargs.get("stream"):
+                # Reading the content here would load the body the caller streams
+                size = int(response.headers.get("Content-Length", 0))
+            else:
+                # Bytes received, compressed when the server gzipped the body
+                size = len(response.content)
+                if response.headers.get("Content-Encoding") and hasattr(response.raw, "tell"):
+                    size = response.raw.tell()
+            self.stats.record(endpoint, time.perf_counter() - start, response.ok, size)
+            span.set("status", status_code)
+            span.set("bytes", size)
+            return response
+
+    def pages(self, endpoint, size=None, fields=None):
+        # Yields a paged endpoint one page at a time. While the caller works on
+        # page N, page N+1 is already being fetched on a background thread, so
+        # at most two pages are held in memory whatever the inventory size.
+        # Items are projected on fields, in streaming mode before the next one
+        # is decoded, so a page only holds the attributes the caller reads.
+        # Raises PageError when a page cannot be read
+        separator = '&' if '?' in endpoint else '?'
+        size = size or self.page_size
+        # Prefetched pages are fetched on another thread, their spans belong to the caller's
+        parent = self.tracer.current()
+
+        def fetch(page):
+            page_endpoint = endpoint + separator + 'size=' + str(size) + '&page=' + str(page)
+            with self.tracer.span("page " + endpoint.split("?")[0], parent=parent, page=page) as span:
+                # Answers of conditional endpoints are kept whole, they are small
+                if self.streaming and not self.validators.applies(endpoint):
+                    status_code, items = self.get_items(page_endpoint, fields)
+                    response_data = list(items) if items is not None else None
+                else:
+                    status_code, response_data = self.get(page_endpoint)
+                    if fields is not None and response_data is not None:
+                        response_data = [project(item, fields) for item in response_data]
+                span.set("items", len(response_data) if response_data is not None else 0)
+                return status_code, response_data
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = 1
+            status_code, response_data = fetch(page)
+            while True:
+                if status_code != 200 or response_data is None:
+                    # A partial inventory must not pass for a complete one
+                    raise PageError(f"Error fetching page {page} of {endpoint}: {status_code}")
+                next_page = None
+                more = len(response_data) == size
+                if more and self.prefetch:
+                    next_page = executor.submit(fetch, page + 1)
+                yield response_data
+                if not more:
+                    return
+                page += 1
+                status_code, response_data = next_page.result() if next_page else fetch(page)
+
+    def paginate(self, endpoint, size=None, fields=None):
+        # Yields the items of every page of a paged endpoint. In streaming mode
+        # each item is handed to the caller as soon as it is decoded. Raises
+        # PageError when a page cannot be read
+        if not self.streaming or self.validators.applies(endpoint):
+            for response_data in self.pages(endpoint, size, fields):
+                yield from response_data
+            return
+
+        separator = '&' if '?' in endpoint else '?'
+        size = size or self.page_size
+        page = 1
+        while True:
+            # The span of a page includes the caller's work on its items
+            with self.tracer.span("page " + endpoint.split("?")[0], page=page) as span:
+                status_code, items = self.get_items(endpoint + separator + 'size=' + str(size) + '&page=' + str(page), fields)
+                if status_code != 200 or items is None:
+                    raise PageError(f"Error fetching page {page} of {endpoint}: {status_code}")
+                count = 0
+                for item in items:
+                    count += 1
+                    yield item
+                span.set("items", count)
+            if count < size:
+                return
+            page += 1
+
+    def connection_stats(self):
+        # urllib3 counts the connections each pool opened and the requests sent
+        # over them, every request beyond the opened connections was a reuse
+        connections = 0
+        requests_sent = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+        return {
+            "requests": requests_sent,
+            "connections": connections,
+            "reused": max(requests_sent - connections, 0),
+        }
+
+    def for_cycle(self, stats: RequestStats):
+        # A client for one collection of the daemon, sharing the session, token, servers and
+        # limiter of this long-lived one. It starts from the configured paging settings and
+        # collect() sets its deadline to 0 at the end, so collectors abandoned in a collection
+        # cannot send requests or write validators into the next one
+        client = copy.copy(self)
+        client.stats = stats
+        client.breaker = CircuitBreaker(self.base_url)
+        client.deadline = None
+        client.recorder = None
+        client.tracer = NULL_TRACER
+        client.validators = ValidatorCache(self.validators.bodies)
+        return client
+
+    def close(self):
+        # Collectors abandoned at their deadline may still hold this client
+        self.deadline = 0
+        self.session.close()
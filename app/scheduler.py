@@ -0,0 +1,117 @@
+import aria.ops.adapter_logging as logging
+import constants
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from aria.ops.timer import Timer
+
+from tracer import NULL_TRACER
+
+logger = logging.getLogger(__name__)
+
+class CollectionScheduler:
+    """
+    Runs collectors on a bounded thread pool. Each collector declares the
+    collectors whose results it needs and is started as soon as all of them have
+    finished, so independent collectors run at the same time. A collector that
+    fails, or runs past its own budget or the deadline of the whole cycle, is
+    skipped and the others go on; collectors requiring it still run with the
+    objects it registered before it was skipped. Threads cannot be interrupted,
+    so a skipped collector is abandoned and its remaining requests are stopped
+    by the deadline of its client.
+    """
+    def __init__(self, max_workers=constants.COLLECTOR_WORKERS, deadline=None, budget=None, tracer=NULL_TRACER):
+        self.max_workers = max_workers
+        # Lowered by the memory governor to start fewer collectors at a time
+        self.max_running = max_workers
+        self.deadline = deadline
+        self.budget = budget
+        self.collectors = {}
+        self.durations = {}
+        self.running = set()
+        self.skipped = {}
+        self.tracer = tracer
+
+    def add(self, name, function, *args, requires=()):
+        self.collectors[name] = (function, args, tuple(requires))
+
+    def run(self):
+        for name, (function, args, requires) in self.collectors.items():
+            for required in requires:
+                if required not in self.collectors:
+                    raise ValueError(f"Collector '{name}' requires unknown collector '{required}'")
+
+        results = {}
+        pending = dict(self.collectors)
+        running = {}
+        started = {}
+        # Collector spans are children of the span run() is called in
+        parent = self.tracer.current()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                skipping = len(self.skipped)
+                for name, (function, args, requires) in list(pending.items()):
+                    if self.deadline is not None and time.monotonic() >= self.deadline:
+                        del pending[name]
+                        self._skip(name, "cycle deadline reached before it started")
+                    elif running and len(running) >= self.max_running:
+                        continue
+                    elif all(required in results or required in self.skipped for required in requires):
+                        del pending[name]
+                        started[name] = time.monotonic()
+                        running[executor.submit(self._run, name, function, args, parent)] = name
+                if not running:
+                    if len(self.skipped) == skipping:
+                        raise ValueError(f"Collectors with circular requirements: {sorted(pending)}")
+                    continue
+
+                done, _ = wait(running, timeout=self._timeout(running, started), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logger.exception(e)
+                        self._skip(name, "failed with " + repr(e))
+
+                now = time.monotonic()
+                for future, name in list(running.items()):
+                    if now >= self._expiry(started[name]):
+                        del running[future]
+                        self.durations[name] = now - started[name]
+                        self._skip(name, f"exceeded its time budget after {now - started[name]:.1f}s")
+        finally:
+            # Abandoned collectors must not hold up the end of the collection
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def _expiry(self, start):
+        expiry = float("inf")
+        if self.budget is not None:
+            expiry = start + self.budget
+        if self.deadline is not None:
+            expiry = min(expiry, self.deadline)
+        return expiry
+
+    def _timeout(self, running, started):
+        expiry = min(self._expiry(started[name]) for name in running.values())
+        if expiry == float("inf"):
+            return None
+        return max(expiry - time.monotonic(), 0)
+
+    def _skip(self, name, reason):
+        self.skipped[name] = reason
+        logger.warning(f"Skipped collector {name}: {reason}")
+
+    def _run(self, name, function, args, parent=None):
+        start = time.perf_counter()
+        self.running.add(name)
+        try:
+            with self.tracer.span(name, parent=parent), Timer(logger, name):
+                return function(*args)
+        finally:
+            self.running.discard(name)
+            # A collector abandoned at its deadline keeps the duration it was given up at
+            self.durations.setdefault(name, time.perf_counter() - start)
@@ -0,0 +1,112 @@
+import aria.ops.adapter_logging as logging
+import constants
+import math
+import threading
+from aria.ops.object import Object
+from aria.ops.object import Identifier
+from aria.ops.object import Key
+
+logger = logging.getLogger(__name__)
+
+class adapterInstanceHealth(Object):
+    def __init__(self, name, id):
+        self.name = name
+        self.id = id
+        super().__init__(
+            key=Key(
+                name=name,
+                adapter_kind=constants.ADAPTER_KIND,
+                object_kind="adapterInstanceHealth",
+                identifiers=[Identifier(key="uuid", value=id)],
+            )
+        )
+
+class RequestStats:
+    """
+    Call count, error count, bytes received and latencies of the REST calls,
+    per endpoint family (/rest/<family>/...). Shared by the clients of all pods.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {
+            family: {"calls": 0, "errors": 0, "retries": 0, "circuit_open": 0, "bytes": 0, "latencies": []}
+            for family in constants.ENDPOINT_FAMILIES
+        }
+
+    def record(self, endpoint, elapsed, ok, size):
+        family = self.families.get(endpoint_family(endpoint))
+        if family is None:
+            return
+        with self.lock:
+            family["calls"] += 1
+            family["bytes"] += size
+            family["latencies"].append(elapsed * 1000)
+            if not ok:
+                family["errors"] += 1
+
+    def record_retry(self, endpoint):
+        family = self.families.get(endpoint_family(endpoint))
+        if family is not None:
+            with self.lock:
+                family["retries"] += 1
+
+    def record_circuit_open(self, endpoint):
+        # Number of connection servers on which the family's circuit opened
+        family = self.families.get(endpoint_family(endpoint))
+        if family is not None:
+            with self.lock:
+                family["circuit_open"] += 1
+
+    def summary(self):
+        with self.lock:
+            return {
+                name: {
+                    "calls": family["calls"],
+                    "errors": family["errors"],
+                    "retries": family["retries"],
+                    "circuit_open": family["circuit_open"],
+                    "bytes_received": family["bytes"],
+                    "latency_p50": percentile(family["latencies"], 50),
+                    "latency_p95": percentile(family["latencies"], 95),
+                    "latency_p99": percentile(family["latencies"], 99),
+                }
+                for name, family in self.families.items()
+            }
+
+def endpoint_family(endpoint):
+    parts = endpoint.split("?")[0].split("/")
+    return parts[2] if len(parts) > 2 and parts[1] == "rest" else None
+
+def percentile(values, rank):
+    # Nearest-rank percentile, 0 when there are no values
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+def get_adapter_health(host, stats: RequestStats, durations, collection_duration, object_count, governor=None, skipped=()) -> adapterInstanceHealth:
+    health = adapterInstanceHealth("Adapter Instance Health " + host, host)
+    health.with_metric("collection_duration", collection_duration)
+    health.with_metric("object_count", object_count)
+    if governor is not None:
+        health.with_metric("memory|peak_rss", governor.peak / 1048576)
+        health.with_metric("memory|pressure_level", governor.level)
+        health.with_property("memory|peak_stage", governor.peak_stage)
+    for family, values in stats.summary().items():
+        for key, value in values.items():
+            health.with_metric(family + "|" + key, value)
+
+    # Collectors of several pods run side by side, the slowest pod is reported
+    collectorDurations = {}
+    for name, duration in durations.items():
+        collector = name.rsplit(":", 1)[-1]
+        collectorDurations[collector] = max(duration, collectorDurations.get(collector, 0))
+    for collector, duration in collectorDurations.items():
+        health.with_metric("collectors|" + collector + "|duration", duration)
+
+    # 1 when the collector was skipped on at least one pod, its objects are partial
+    skippedCollectors = {name.rsplit(":", 1)[-1] for name in skipped}
+    health.with_metric("skipped_collectors", len(skipped))
+    for collector in constants.COLLECTORS:
+        health.with_metric("collectors|" + collector + "|skipped", int(collector in skippedCollectors))
+    return health
@@ -0,0 +1,60 @@
+import aria.ops.adapter_logging as logging
+import constants
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = "round_robin"
+LEAST_LATENCY = "least_latency"
+
+class ServerPool:
+    """
+    The connection servers of one pod that read requests are spread across,
+    either in turn or to the server with the lowest latency for its load. A
+    server answering with a connection error or a 429/5xx is left out for a
+    cooldown period, and when every server is out the one that comes back
+    first is used.
+    """
+    def __init__(self, urls, strategy=ROUND_ROBIN, cooldown=constants.SERVER_COOLDOWN):
+        self.urls = list(urls)
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.latency = {url: 0.0 for url in self.urls}
+        self.in_flight = {url: 0 for url in self.urls}
+        self.requests = {url: 0 for url in self.urls}
+        self.unhealthy_until = {url: 0.0 for url in self.urls}
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def pick(self):
+        with self.lock:
+            now = time.monotonic()
+            healthy = [url for url in self.urls if self.unhealthy_until[url] <= now]
+            if not healthy:
+                url = min(self.urls, key=self.unhealthy_until.get)
+            elif self.strategy == LEAST_LATENCY:
+                # Servers not measured yet have no latency and are tried first
+                url = min(healthy, key=lambda url: self.latency[url] * (self.in_flight[url] + 1))
+            else:
+                url = healthy[self.next % len(healthy)]
+                self.next += 1
+            self.in_flight[url] += 1
+            self.requests[url] += 1
+            return url
+
+    def report(self, url, latency, failed):
+        with self.lock:
+            self.in_flight[url] -= 1
+            if latency is not None:
+                # Exponentially weighted moving average of the response times
+                previous = self.latency[url]
+                self.latency[url] = latency if previous == 0 else previous + constants.LATENCY_SMOOTHING * (latency - previous)
+            if failed:
+                if self.unhealthy_until[url] <= time.monotonic() and len(self.urls) > 1:
+                    logger.warning(f"Connection server {url} marked unhealthy for {self.cooldown}s")
+                self.unhealthy_until[url] = time.monotonic() + self.cooldown
+
+    def summary(self):
+        with self.lock:
+            return {url: {"requests": self.requests[url], "latency_ms": round(self.latency[url] * 1000, 1)} for url in self.urls}
@@ -0,0 +1,105 @@
+import aria.ops.adapter_logging as logging
+import constants
+from aria.ops.object import Identifier
+from aria.ops.object import Key
+from aria.ops.object import Object
+
+from cache import PersistentCache
+from linker import ObjectIndex
+
+logger = logging.getLogger(__name__)
+
+class inventoryObject(Object):
+    def __init__(self, kind, name, id):
+        self.name = name
+        self.id = id
+        super().__init__(
+            key=Key(
+                name=name,
+                adapter_kind=constants.ADAPTER_KIND,
+                object_kind=kind,
+                identifiers=[Identifier(key="uuid", value=id)],
+            )
+        )
+
+class InventorySnapshots:
+    """
+    Objects of slow-changing kinds (sites, pods, entitlements, pools, farms)
+    saved in the persistent cache after each refresh. Until the refresh interval
+    has passed, the collectors of those kinds are replaced by a load of their
+    last snapshot, which registers the objects again with fresh timestamps and
+    declares their relationships so link() rebuilds them.
+    """
+    def __init__(self, cache: PersistentCache, index: ObjectIndex, scope):
+        self.cache = cache
+        self.index = index
+        self.type = "inventorySnapshot@" + scope
+        self.refreshed = []
+
+    def apply(self, scheduler):
+        # Wraps every inventory collector of the scheduler
+        for name, (function, args, requires) in list(scheduler.collectors.items()):
+            if name.rsplit(":", 1)[-1] in constants.INVENTORY_COLLECTORS:
+                scheduler.collectors[name] = (self._collect_or_load, (name, function, args), requires)
+
+    def _collect_or_load(self, name, function, args):
+        objects = self.load(name)
+        if objects is not None:
+            return objects
+        objects = function(*args)
+        self.refreshed.append(name)
+        return objects
+
+    def load(self, name):
+        snapshot = self.cache.get(self.type, name)
+        if snapshot is None:
+            return None
+        objects = []
+        for entry in snapshot:
+            obj = inventoryObject(entry["kind"], entry["name"], entry["id"])
+            for key, value in entry["metrics"].items():
+                obj.with_metric(key, value)
+            for key, value in entry["properties"].items():
+                obj.with_property(key, value)
+            for relation, kind, id in entry["relationships"]:
+                if relation == "parent":
+                    self.index.add_parent(obj, kind, id)
+                else:
+                    self.index.add_child(obj, kind, id)
+            self.index.register(obj)
+            objects.append(obj)
+        logger.info(f"Loaded {len(objects)} objects of {name} from the inventory snapshot")
+        return objects
+
+    def save(self, collected):
+        # Must run before link(), which consumes the declared relationships
+        snapshots = {}
+        for name in self.refreshed:
+            objects = collected.get(name)
+            if not objects:
+                # An empty result may be a failed request, refetch it next cycle
+                continue
+            relationships = {}
+            for obj, relation, kind, id in self.index.relationships_of(objects):
+                relationships.setdefault(obj.id, []).append((relation, kind, id))
+            snapshots[name] = [snapshot_entry(obj, relationships.get(obj.id, [])) for obj in objects]
+        self.cache.put_many(self.type, snapshots)
+
+def snapshot_entry(obj: Object, relationships):
+    data = obj.get_json()
+    return {
+        "kind": obj.object_type(),
+        "name": obj.name,
+        "id": obj.id,
+        "metrics": last_values(data["metrics"]),
+        "properties": last_values(data["properties"]),
+        "relationships": relationships,
+    }
+
+def last_values(values):
+    # Metrics computed by other collectors each cycle are not part of the inventory
+    return {
+        value["key"]: value.get("numberValue", value.get("stringValue"))
+        for value in values
+        if value["key"] not in constants.SESSION_CHURN_METRICS
+    }
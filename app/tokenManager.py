@@ -0,0 +1,151 @@
+import aria.ops.adapter_logging as logging
+import base64
+import constants
+import json
+import os
+import threading
+import time
+from installSecret import keyed_digest
+
+logger = logging.getLogger(__name__)
+
+class AuthenticationError(Exception):
+    pass
+
+class TokenManager:
+    """
+    Logs in to the connection server and keeps its access and refresh tokens.
+    Tokens are cached between runs in a file only readable by the adapter user and
+    keyed by an HMAC of the server and credentials with a secret of the install.
+    An expired access token is renewed through /rest/refresh, a full login is
+    only done when no refresh token is left or the server no longer accepts it.
+    """
+    def __init__(self, client, user, password, domain, path=constants.TOKEN_FILE):
+        self.client = client
+        self.user = user
+        self.password = password
+        self.domain = domain
+        self.path = path
+        self.key = keyed_digest(client.base_url, domain, user, password)
+        self.lock = threading.Lock()
+        self.access_token = None
+        self.access_expires = 0
+        self.refresh_token = None
+        self.refresh_expires = 0
+        self.loaded = False
+
+    def token(self):
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            if not self._valid(self.access_expires):
+                self._renew()
+            return self.access_token
+
+    def renew(self, rejected_token=None):
+        # Called when the server answered 401, another thread may already have
+        # replaced the rejected token
+        with self.lock:
+            if rejected_token is None or rejected_token == self.access_token:
+                self.access_token = None
+                self.access_expires = 0
+                self._renew()
+            return self.access_token
+
+    def _renew(self):
+        if self.refresh_token and self._valid(self.refresh_expires) and self._refresh():
+            logger.info("Access token refreshed")
+        else:
+            self._login()
+            logger.info("Logged in to the connection server")
+        self._save()
+
+    def _login(self):
+        payload = json.dumps({
+            "username": self.user,
+            "password": self.password,
+            "domain": self.domain,
+        })
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': '*/*',
+        }
+        status_code, response_data = self.client.post("/rest/login", headers, payload)
+        if status_code != 200 or not isinstance(response_data, dict) or not response_data.get("access_token"):
+            raise AuthenticationError(f"Login to {self.client.base_url} failed with status {status_code}")
+        self._set(response_data["access_token"], response_data.get("refresh_token"))
+
+    def _refresh(self):
+        payload = json.dumps({"refresh_token": self.refresh_token})
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': '*/*',
+        }
+        status_code, response_data = self.client.post("/rest/refresh", headers, payload)
+        if status_code != 200 or not isinstance(response_data, dict) or not response_data.get("access_token"):
+            logger.info(f"Token refresh failed with status {status_code}")
+            self.refresh_token = None
+            self.refresh_expires = 0
+            return False
+        self._set(response_data["access_token"], response_data.get("refresh_token", self.refresh_token))
+        return True
+
+    def _set(self, access_token, refresh_token):
+        now = time.time()
+        self.access_token = access_token
+        self.access_expires = _expiry(access_token, now + constants.ACCESS_TOKEN_LIFETIME)
+        if refresh_token != self.refresh_token:
+            self.refresh_token = refresh_token
+            self.refresh_expires = _expiry(refresh_token, now + constants.REFRESH_TOKEN_LIFETIME)
+
+    def _valid(self, expires):
+        return expires - constants.TOKEN_EXPIRY_MARGIN > time.time()
+
+    def _load(self):
+        self.loaded = True
+        entry = self._read().get(self.key)
+        if entry:
+            self.access_token = entry.get("access_token")
+            self.access_expires = entry.get("access_expires", 0)
+            self.refresh_token = entry.get("refresh_token")
+            self.refresh_expires = entry.get("refresh_expires", 0)
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot read token cache '{self.path}': {e}")
+            return {}
+
+    def _save(self):
+        now = time.time()
+        entries = {
+            key: entry for key, entry in self._read().items()
+            if entry.get("refresh_expires", 0) > now or entry.get("access_expires", 0) > now
+        }
+        entries[self.key] = {
+            "access_token": self.access_token,
+            "access_expires": self.access_expires,
+            "refresh_token": self.refresh_token,
+            "refresh_expires": self.refresh_expires,
+        }
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            descriptor = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(entries, file)
+            os.replace(temp, self.path)
+        except OSError as e:
+            logger.warning(f"Cannot write token cache '{self.path}': {e}")
+
+def _expiry(token, default):
+    # Horizon tokens are JWTs, their 'exp' claim tells when they expire
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return default
@@ -0,0 +1,180 @@
+import aria.ops.adapter_logging as logging
+import constants
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+CHROME = "chrome"
+OTLP = "otlp"
+FORMATS = [OFF, CHROME, OTLP]
+
+# OTLP span kinds
+INTERNAL = 1
+CLIENT = 3
+
+class Span:
+    def __init__(self, tracer, name, parent, kind, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.id = os.urandom(8).hex()
+        self.parent = parent
+        self.kind = kind
+        self.attributes = attributes
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter_ns()
+        self.end = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.attributes["error"] = repr(exc)
+        self.end = time.perf_counter_ns()
+        self.tracer._pop(self)
+        return False
+
+class NullSpan:
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Tracer:
+    """
+    Nested spans of one collection: the cycle, each collector, each page and
+    each HTTP request, with their attributes. A span is the child of the span
+    open on its thread, spans started on another thread (collectors, prefetched
+    pages) are given their parent. Written as Chrome trace events, for
+    chrome://tracing or Perfetto, or as OTLP JSON. A disabled tracer hands out a
+    span that does nothing.
+    """
+    def __init__(self, format=OFF):
+        self.format = format
+        self.enabled = format in (CHROME, OTLP)
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Span times are perf_counter based, this maps them to the wall clock
+        self.epoch = time.time_ns() - time.perf_counter_ns()
+
+    def span(self, name, parent=None, kind=INTERNAL, **attributes):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, parent or self.current(), kind, attributes)
+
+    def current(self):
+        if not self.enabled:
+            return None
+        stack = getattr(self.local, "stack", None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def attach(self, span):
+        # Makes a span of another thread the parent of the spans started in this one, for worker pools
+        if not self.enabled or span is None:
+            yield
+            return
+        self._push(span)
+        try:
+            yield
+        finally:
+            self.local.stack.remove(span)
+
+    def _push(self, span):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        self.local.stack.append(span)
+
+    def _pop(self, span):
+        # A span closed by another thread, e.g. an abandoned page generator, is not on this stack
+        stack = getattr(self.local, "stack", [])
+        if span in stack:
+            stack.remove(span)
+        with self.lock:
+            self.spans.append(span)
+
+    def write(self, path):
+        if not self.enabled:
+            return
+        with self.lock:
+            spans = list(self.spans)
+        trace = self._chrome(spans) if self.format == CHROME else self._otlp(spans)
+        with open(path, "w") as file:
+            json.dump(trace, file)
+        logger.info(f"Trace of {len(spans)} spans written to {path}")
+
+    def _chrome(self, spans):
+        pid = os.getpid()
+        threads = {}
+        events = []
+        for span in spans:
+            threads.setdefault(span.thread, len(threads))
+            args = dict(span.attributes)
+            if span.parent is not None:
+                args["parent"] = span.parent.name
+            events.append({
+                "name": span.name,
+                "cat": span.name.split(" ")[0],
+                "ph": "X",
+                "ts": (span.start + self.epoch) / 1000,
+                "dur": (span.end - span.start) / 1000,
+                "pid": pid,
+                "tid": threads[span.thread],
+                "args": args,
+            })
+        names = {thread: next((t.name for t in threading.enumerate() if t.ident == thread), f"thread-{number}")
+                 for thread, number in threads.items()}
+        for thread, number in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": number, "args": {"name": names[thread]}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def _otlp(self, spans):
+        return {"resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": constants.ADAPTER_KIND})},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [{
+                    "traceId": self.trace_id,
+                    "spanId": span.id,
+                    "parentSpanId": span.parent.id if span.parent is not None else "",
+                    "name": span.name,
+                    "kind": span.kind,
+                    "startTimeUnixNano": str(span.start + self.epoch),
+                    "endTimeUnixNano": str(span.end + self.epoch),
+                    "attributes": otlp_attributes(span.attributes),
+                    "status": {"code": 2, "message": span.attributes["error"]} if "error" in span.attributes else {},
+                } for span in spans],
+            }],
+        }]}
+
+def otlp_attributes(attributes):
+    values = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            values.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            values.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            values.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            values.append({"key": key, "value": {"stringValue": str(value)}})
+    return values
+
+NULL_TRACER = Tracer()
@@ -0,0 +1,172 @@
+import aria.ops.adapter_logging as logging
+import base64
+import constants
+import gzip
+import io
+import json
+import threading
+import time
+from collections import deque
+from http.client import responses
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "REDACTED"
+
+class TrafficRecorder:
+    """
+    Records every request a RestClient sends, with its response or connection
+    error and timing, to a gzip compressed JSON lines archive. The first line
+    describes the recording, each following line one request. Authorization and
+    cookie headers are dropped and passwords and tokens are redacted from login
+    and refresh bodies, so an archive can leave the customer site.
+    """
+    def __init__(self, path, identifiers=None):
+        self.path = path
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.count = 0
+        self._write({
+            "version": 1,
+            "recorded_at": time.time(),
+            "identifiers": identifiers or {},
+        })
+
+    def record(self, pod, method, url, kwargs, start, elapsed, response=None, error=None):
+        entry = {
+            "pod": pod,
+            "method": method,
+            "path": path_of(url),
+            "offset": round(start - self.start, 6),
+            "elapsed": round(elapsed, 6),
+        }
+        if kwargs.get("data"):
+            entry["request_body"] = redact_body(kwargs["data"])
+        if error is not None:
+            entry["error"] = type(error).__name__
+            entry["message"] = str(error)
+        else:
+            # Only login and refresh answers carry secrets, inventory pages are kept as sent
+            content = response.content
+            if method != "GET":
+                content = redact_body(content).encode()
+            entry["status"] = response.status_code
+            # The body is kept decoded
+            entry["headers"] = {
+                key: value for key, value in response.headers.items()
+                if key.lower() not in constants.REDACTED_HEADERS + ["content-encoding", "transfer-encoding"]
+            }
+            entry["headers"]["Content-Length"] = str(len(content))
+            try:
+                entry["body"] = content.decode("utf-8")
+            except UnicodeDecodeError:
+                entry["body_base64"] = base64.b64encode(content).decode()
+        self._write(entry)
+
+    def _write(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            if self.file is not None:
+                self.file.write(line)
+                self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                logger.info(f"Recorded {self.count - 1} requests to {self.path}")
+
+class ReplayTransport(BaseAdapter):
+    """
+    A requests transport answering from the recording of one pod, mounted on the
+    session of its RestClient in place of the HTTP adapter. Requests are matched
+    on method and path with query, repeated requests get the recorded answers
+    in order and then the last one again. Each answer is delayed by its recorded
+    duration divided by speed, speed 0 answers at once. Requests that were not
+    recorded are answered 404 and counted in missing.
+    """
+    def __init__(self, entries, speed=1.0):
+        super().__init__()
+        self.speed = speed
+        self.answers = {}
+        for entry in entries:
+            self.answers.setdefault((entry["method"], entry["path"]), deque()).append(entry)
+        self.lock = threading.Lock()
+        self.missing = []
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = (request.method, path_of(request.url))
+        with self.lock:
+            answers = self.answers.get(key)
+            entry = None
+            if answers:
+                entry = answers.popleft() if len(answers) > 1 else answers[0]
+            else:
+                self.missing.append(key)
+        if entry is None:
+            logger.warning(f"No recorded answer to {request.method} {key[1]}")
+            return build_response(request, 404, {}, b"")
+        if self.speed:
+            time.sleep(entry["elapsed"] / self.speed)
+        if "error" in entry:
+            raise requests.ConnectionError(f"Replayed {entry['error']}: {entry['message']}", request=request)
+        if "body_base64" in entry:
+            body = base64.b64decode(entry["body_base64"])
+        else:
+            body = entry.get("body", "").encode("utf-8")
+        return build_response(request, entry["status"], entry["headers"], body)
+
+    def close(self):
+        pass
+
+def load(path):
+    # Returns the description of a recording and its requests grouped by pod
+    pods = {}
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        header = json.loads(file.readline())
+        for line in file:
+            entry = json.loads(line)
+            pods.setdefault(entry["pod"], []).append(entry)
+    return header, pods
+
+def build_response(request, status, headers, body):
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    # Like a urllib3 response, the body is read from raw, streamed or not
+    response.raw = io.BytesIO(body)
+    response.url = request.url
+    response.request = request
+    response.reason = responses.get(status, "")
+    return response
+
+def path_of(url):
+    parts = urlsplit(url)
+    return parts.path + ("?" + parts.query if parts.query else "")
+
+def redact_body(body):
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+    try:
+        return json.dumps(redact(json.loads(body)))
+    except ValueError:
+        return body
+
+def redact(value):
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key.lower() in constants.REDACTED_FIELDS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
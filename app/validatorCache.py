@@ -0,0 +1,90 @@
+import aria.ops.adapter_logging as logging
+import constants
+import hashlib
+import json
+import threading
+
+from cache import PersistentCache
+
+logger = logging.getLogger(__name__)
+
+class ValidatorCache:
+    """
+    Conditional GETs of the slow-changing endpoints of one RestClient. The ETag,
+    Last-Modified and content hash of the last answer to each URL are kept in
+    the persistent cache, with its body when the server sent a validator, and
+    the next request carries If-None-Match / If-Modified-Since. A 304 answer is
+    served from the decoded body kept in memory, or from the cached one. When the
+    server sends no validator only the hash is persisted, so an unchanged answer
+    is only spared its decode where the previous body is still in memory, i.e. in
+    daemon mode, whose clients live across collections. A collection run in its
+    own process decodes it again and only counts it as unchanged. Bodies are
+    shared between callers and must not be modified.
+    """
+    def __init__(self, bodies=None):
+        # Set by collect() for the duration of a collection
+        self.cache: PersistentCache = None
+        self.lock = threading.Lock()
+        # url -> (hash, decoded body), shared by the clients of each collection of the daemon
+        self.bodies = {} if bodies is None else bodies
+        self.counts = {"not_modified": 0, "unchanged": 0, "changed": 0}
+
+    def applies(self, endpoint):
+        return self.cache is not None and endpoint.split("?")[0] in constants.CONDITIONAL_ENDPOINTS
+
+    def conditional_headers(self, url):
+        # Returns the headers to send and the cached entry they come from
+        entry = self.cache.get(constants.VALIDATOR_CACHE_TYPE, url)
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers, entry
+
+    def not_modified(self, url, entry):
+        self._count("not_modified")
+        with self.lock:
+            memo = self.bodies.get(url)
+        if memo and memo[0] == entry["hash"]:
+            return memo[1]
+        data = json.loads(entry["body"])
+        with self.lock:
+            self.bodies[url] = (entry["hash"], data)
+        return data
+
+    def update(self, url, response, entry):
+        # Returns the decoded body of a 200 answer, raises ValueError like response.json()
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            memo = self.bodies.get(url)
+        if memo and memo[0] == digest:
+            data = memo[1]
+        else:
+            data = response.json()
+            with self.lock:
+                self.bodies[url] = (digest, data)
+        self._count("unchanged" if entry and entry["hash"] == digest else "changed")
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        validated = {"hash": digest}
+        if etag or last_modified:
+            validated.update(etag=etag, last_modified=last_modified, body=content.decode(response.encoding or "utf-8"))
+        # An answer arriving after its collection ended is not cached
+        cache = self.cache
+        if cache is not None and validated != entry:
+            cache.put(constants.VALIDATOR_CACHE_TYPE, url, validated)
+        return data
+
+    def _count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def summary(self):
+        with self.lock:
+            counts = dict(self.counts)
+            for outcome in self.counts:
+                self.counts[outcome] = 0
+        return counts
@@ -0,0 +1,157 @@
+"""
+Scale benchmark for adapter.collect(). Starts benchmark/mockHorizon.py in a
+separate process with a synthetic inventory, runs one or more collection cycles
+in this process and reports, per cycle, the wall time, requests per endpoint,
+peak RSS and number of objects emitted.
+
+    python benchmark/benchmark.py --sessions 10000 --rds-hosts 500 --farms 50 --latency-ms 5 --cycles 2
+
+Cycles after the first run with the caches and tokens left by the previous
+ones, like consecutive collections of one adapter instance. Each benchmark run
+starts from an empty working directory.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import requests
+import urllib3
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+import mockHorizon
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "app")
+
+def start_mock(arguments):
+    command = [
+        sys.executable, os.path.join(BENCHMARK_DIR, "mockHorizon.py"),
+        "--port", "0",
+        "--sessions", str(arguments.sessions),
+        "--rds-hosts", str(arguments.rds_hosts),
+        "--farms", str(arguments.farms),
+        "--desktop-pools", str(arguments.desktop_pools),
+        "--application-pools", str(arguments.application_pools),
+        "--vdi-ratio", str(arguments.vdi_ratio),
+        "--latency-ms", str(arguments.latency_ms),
+    ]
+    if arguments.gzip:
+        command.append("--gzip")
+    if arguments.etags:
+        command.append("--etags")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("Mock Horizon listening on"):
+        process.kill()
+        raise RuntimeError("Mock Horizon server did not start")
+    return process, line.strip().rsplit(" ", 1)[1]
+
+def load_adapter():
+    # The SDK reads the pipe names from sys.argv when it is imported
+    sys.path.insert(0, APP_DIR)
+    argv = sys.argv
+    sys.argv = [argv[0], "collect", "input", "output"]
+    try:
+        import adapter
+        from aria.ops.adapter_instance import AdapterInstance
+    finally:
+        sys.argv = argv
+    return adapter, AdapterInstance
+
+def adapter_instance(AdapterInstance, url, parameters):
+    host, port = url.split("//")[1].rsplit(":", 1)
+    identifiers = {"host": host, "port": port, "container_memory_limit": "1024"}
+    identifiers.update(parameters)
+    now = int(time.time() * 1000)
+    return AdapterInstance({
+        "adapter_key": {
+            "name": "benchmark",
+            "adapter_kind": "ManagementPackforOmnissaMultiPods",
+            "object_kind": "ManagementPackforOmnissaMultiPods_adapter_instance",
+            "identifiers": [
+                {"key": key, "value": value, "is_part_of_uniqueness": key in ("host", "port")}
+                for key, value in identifiers.items()
+            ],
+        },
+        "credential_config": {
+            "credential_key": "vdi_user",
+            "credential_fields": [
+                {"key": "user", "value": "benchmark", "is_password": False},
+                {"key": "password", "value": "benchmark", "is_password": True},
+                {"key": "domain", "value": "example", "is_password": False},
+            ],
+        },
+        "collection_number": 0,
+        "collection_window": {"start_time": now - 300000, "end_time": now},
+    })
+
+def run_cycle(adapter, instance, url):
+    requests.post(url + "/mock/reset", verify=False)
+    start = time.perf_counter()
+    result = adapter.collect(instance)
+    wall_time = time.perf_counter() - start
+    stats = requests.get(url + "/mock/stats", verify=False).json()
+    output = result.get_json()
+    objects = Counter(obj["key"]["objectKind"] for obj in output.get("result", []))
+    return {
+        "wall_time": round(wall_time, 3),
+        "requests": stats["total"],
+        "bytes_received": stats["bytes"],
+        "requests_per_endpoint": dict(sorted(stats["requests"].items())),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "objects": sum(objects.values()),
+        "objects_per_kind": dict(sorted(objects.items())),
+        "error": output.get("errorMessage"),
+    }
+
+def report(cycles):
+    for number, cycle in enumerate(cycles, 1):
+        print(f"Cycle {number}")
+        print(f"  wall time      {cycle['wall_time']:.3f} s")
+        print(f"  requests       {cycle['requests']} ({cycle['bytes_received']} bytes)")
+        print(f"  peak RSS       {cycle['peak_rss_mb']} MB")
+        print(f"  objects        {cycle['objects']}")
+        if cycle["error"]:
+            print(f"  error          {cycle['error']}")
+        for endpoint, count in cycle["requests_per_endpoint"].items():
+            print(f"    {count:>7}  {endpoint}")
+        for kind, count in cycle["objects_per_kind"].items():
+            print(f"    {count:>7}  {kind}")
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark adapter.collect() against a mock Horizon server")
+    mockHorizon.add_inventory_arguments(parser)
+    parser.add_argument("--cycles", type=int, default=1)
+    parser.add_argument("--parameter", action="append", default=[], metavar="KEY=VALUE",
+                        help="Adapter instance parameter passed to collect()")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    arguments = parser.parse_args(argv)
+    parameters = dict(parameter.split("=", 1) for parameter in arguments.parameter)
+
+    process, url = start_mock(arguments)
+    workdir = tempfile.TemporaryDirectory(prefix="benchmark")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir.name)
+        adapter, AdapterInstance = load_adapter()
+        instance = adapter_instance(AdapterInstance, url, parameters)
+        cycles = [run_cycle(adapter, instance, url) for _ in range(arguments.cycles)]
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+        process.terminate()
+        process.wait()
+
+    if arguments.json:
+        print(json.dumps(cycles, indent=2))
+    else:
+        report(cycles)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
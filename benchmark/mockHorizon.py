@@ -0,0 +1,318 @@
+"""
+Local stand-in for the Horizon connection server REST API used by the collectors
+in app/. It serves a synthetic inventory of configurable size over HTTPS with a
+self-signed certificate and an optional per-request latency. With --gzip it
+compresses bodies for clients accepting gzip, with --etags it tags the answers
+of the slow-changing endpoints and answers 304 to a matching If-None-Match.
+
+    python benchmark/mockHorizon.py --sessions 10000 --rds-hosts 500 --farms 50 --latency-ms 20
+
+Besides the Horizon endpoints it answers GET /mock/stats with the number of
+requests served per endpoint and POST /mock/reset to clear those counters.
+"""
+import argparse
+import base64
+import collections
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+LIST_ENDPOINTS = {
+    "/rest/inventory/v1/global-desktop-entitlements": "globalDesktopEntitlements",
+    "/rest/inventory/v2/global-application-entitlements": "globalApplicationEntitlements",
+    "/rest/inventory/v4/farms": "farms",
+    "/rest/inventory/v6/desktop-pools": "desktopPools",
+    "/rest/inventory/v3/application-pools": "applicationPools",
+    "/rest/inventory/v1/rds-servers": "rdsServers",
+    "/rest/inventory/v1/sessions": "sessions",
+    "/rest/inventory/v1/machines": "machines",
+    "/rest/external/v1/ad-users-or-groups": "adUsers",
+}
+
+ITEM_ENDPOINTS = {
+    "/rest/inventory/v1/machines/": "machines",
+    "/rest/external/v1/ad-users-or-groups/": "adUsers",
+    "/rest/inventory/v1/desktop-pools/": "desktopPools",
+    "/rest/inventory/v1/farms/": "farms",
+}
+
+def generate_inventory(sessions=1000, rds_hosts=50, farms=5, desktop_pools=20, application_pools=20, vdi_ratio=0.5):
+    """Builds a synthetic inventory with the fields the collectors read."""
+    inventory = {}
+    inventory["globalDesktopEntitlements"] = [
+        {"id": f"gde-{i}", "name": f"Global Desktops {i}", "enabled": True}
+        for i in range(max(desktop_pools // 4, 1))
+    ]
+    inventory["globalApplicationEntitlements"] = [
+        {"id": f"gae-{i}", "name": f"Global Applications {i}", "enabled": True, "scope": "ALL_SITES"}
+        for i in range(max(application_pools // 4, 1))
+    ]
+    inventory["pods"] = [
+        {
+            "id": "pod-local",
+            "name": "Local Pod",
+            "local_pod": True,
+            "active_global_desktop_entitlements": [entitlement["id"] for entitlement in inventory["globalDesktopEntitlements"]],
+            "active_global_application_entitlements": [entitlement["id"] for entitlement in inventory["globalApplicationEntitlements"]],
+        },
+        {"id": "pod-remote", "name": "Remote Pod", "local_pod": False},
+    ]
+    inventory["sites"] = [{"id": "site-1", "name": "Site 1", "pods": ["pod-local", "pod-remote"]}]
+    inventory["farms"] = [
+        {"id": f"farm-{i}", "name": f"Farm {i}", "enabled": True, "type": "AUTOMATED"}
+        for i in range(farms)
+    ]
+    inventory["rdsServers"] = [
+        {
+            "id": f"rds-{i}",
+            "name": f"rds{i:05d}.example.com",
+            "enabled": True,
+            "farm_id": f"farm-{i % farms}",
+            "session_count": 0,
+            "max_sessions_count": 50,
+            "state": "AVAILABLE",
+        }
+        for i in range(rds_hosts)
+    ]
+    inventory["desktopPools"] = [
+        {
+            "id": f"pool-{i}",
+            "name": f"Desktop Pool {i}",
+            "enabled": True,
+            "global_desktop_entitlement_id": f"gde-{i % len(inventory['globalDesktopEntitlements'])}",
+        }
+        for i in range(desktop_pools)
+    ]
+    inventory["applicationPools"] = [
+        {
+            "id": f"app-{i}",
+            "name": f"Application Pool {i}",
+            "enabled": True,
+            "farm_id": f"farm-{i % farms}",
+            "global_application_entitlement_id": f"gae-{i % len(inventory['globalApplicationEntitlements'])}",
+        }
+        for i in range(application_pools)
+    ]
+    inventory["machines"] = []
+    inventory["adUsers"] = []
+    inventory["sessions"] = []
+    inventory["logonTimings"] = {}
+    vdi_sessions = int(sessions * vdi_ratio)
+    for i in range(sessions):
+        session = {
+            "id": f"session-{i}",
+            "user_id": f"S-1-5-21-1000-{i}",
+            "session_type": "DESKTOP",
+            "session_state": "CONNECTED" if i % 10 else "DISCONNECTED",
+            "session_protocol": "BLAST" if i % 3 else "PCOIP",
+            "agent_version": "2406",
+        }
+        if i < vdi_sessions and desktop_pools:
+            session["machine_id"] = f"machine-{i}"
+            session["desktop_pool_id"] = f"pool-{i % desktop_pools}"
+            inventory["machines"].append({"id": f"machine-{i}", "name": f"vdi{i:06d}"})
+        elif rds_hosts:
+            host = inventory["rdsServers"][i % rds_hosts]
+            host["session_count"] += 1
+            session["rds_server_id"] = host["id"]
+            session["farm_id"] = host["farm_id"]
+        inventory["adUsers"].append({"id": session["user_id"], "login_name": f"user{i:06d}"})
+        inventory["sessions"].append(session)
+        inventory["logonTimings"][session["id"]] = 5000 + (i % 60) * 1000
+    return inventory
+
+def make_token(lifetime):
+    header = base64.urlsafe_b64encode(json.dumps({"alg": "none"}).encode()).rstrip(b"=").decode()
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": int(time.time() + lifetime)}).encode()).rstrip(b"=").decode()
+    return f"{header}.{payload}.mock"
+
+class MockHorizonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, inventory, latency=0.0, compress=False, etags=False):
+        super().__init__(address, MockHorizonHandler)
+        self.inventory = inventory
+        self.latency = latency
+        self.compress = compress
+        self.etags = etags
+        self.counts = collections.Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def count(self, endpoint, size):
+        with self.lock:
+            self.counts[endpoint] += 1
+            self.bytes_sent += size
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.counts), "total": sum(self.counts.values()), "bytes": self.bytes_sent}
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+            self.bytes_sent = 0
+
+class MockHorizonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, endpoint, status, body, tagged=False):
+        data = json.dumps(body).encode()
+        headers = {"Content-Type": "application/json"}
+        if tagged and self.server.etags and status == 200:
+            headers["ETag"] = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                status, data = 304, b""
+        if self.server.compress and data and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data, 6)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if endpoint:
+            self.server.count(endpoint, len(data))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = urlparse(self.path).path
+        if path == "/mock/reset":
+            self.server.reset()
+            return self.send_json(None, 200, {})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if path == "/rest/login":
+            credentials = json.loads(body or b"{}")
+            if not credentials.get("username"):
+                return self.send_json(path, 400, {"error_message": "Missing username"})
+            return self.send_json(path, 200, {"access_token": make_token(1800), "refresh_token": make_token(28800)})
+        if path == "/rest/refresh":
+            return self.send_json(path, 200, {"access_token": make_token(1800)})
+        self.send_json(path, 404, {})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path
+        query = parse_qs(url.query)
+        if path == "/mock/stats":
+            return self.send_json(None, 200, self.server.stats())
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self.send_json(path, 401, {"error_message": "Unauthorized"})
+
+        inventory = self.server.inventory
+        if path == "/rest/federation/v1/pods":
+            return self.send_json(path, 200, inventory["pods"], tagged=True)
+        if path == "/rest/federation/v1/sites":
+            return self.send_json(path, 200, inventory["sites"], tagged=True)
+        if path == "/rest/helpdesk/v1/logon-timing/logon-segment":
+            duration = inventory["logonTimings"].get(query.get("session_id", [""])[0])
+            if duration is None:
+                return self.send_json(path, 404, {})
+            segment = {"v1": {"d": duration}}
+            return self.send_json(path, 200, {"logon_segment_data": json.dumps(segment)})
+        if path in LIST_ENDPOINTS:
+            items = inventory[LIST_ENDPOINTS[path]]
+            if "filter" in query:
+                filter = json.loads(query["filter"][0])
+                if filter.get("type") != "In" or filter.get("name") != "id":
+                    return self.send_json(path, 400, {"error_message": "Unsupported filter"})
+                ids = set(filter.get("value", []))
+                items = [item for item in items if item["id"] in ids]
+            size = int(query.get("size", ["1000"])[0])
+            page = int(query.get("page", ["1"])[0])
+            tagged = path not in ("/rest/inventory/v1/sessions", "/rest/inventory/v1/rds-servers") and "filter" not in query
+            return self.send_json(path, 200, items[(page - 1) * size:page * size], tagged)
+        for prefix, kind in ITEM_ENDPOINTS.items():
+            if path.startswith(prefix):
+                id = path[len(prefix):]
+                for item in inventory[kind]:
+                    if item["id"] == id:
+                        return self.send_json(prefix + "{id}", 200, item)
+                return self.send_json(prefix + "{id}", 404, {})
+        self.send_json(path, 404, {})
+
+def create_certificate(directory):
+    if not shutil.which("openssl"):
+        raise RuntimeError("openssl is required to create the mock server certificate")
+    certificate = os.path.join(directory, "mock.crt")
+    key = os.path.join(directory, "mock.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key, "-out", certificate],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return certificate, key
+
+def start_server(inventory, host="127.0.0.1", port=0, latency=0.0, compress=False, etags=False):
+    """Starts the mock on a background thread and returns the server."""
+    server = MockHorizonServer((host, port), inventory, latency, compress, etags)
+    directory = tempfile.mkdtemp(prefix="mockHorizon")
+    certificate, key = create_certificate(directory)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certificate, key)
+    shutil.rmtree(directory)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_inventory_arguments(parser):
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--rds-hosts", type=int, default=50)
+    parser.add_argument("--farms", type=int, default=5)
+    parser.add_argument("--desktop-pools", type=int, default=20)
+    parser.add_argument("--application-pools", type=int, default=20)
+    parser.add_argument("--vdi-ratio", type=float, default=0.5,
+                        help="Share of the sessions running on VDI machines, the others run on RDS hosts")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every request")
+    parser.add_argument("--gzip", action="store_true", help="Compress bodies for clients accepting gzip")
+    parser.add_argument("--etags", action="store_true", help="Send ETags and answer 304 on the slow-changing endpoints")
+
+def inventory_from_arguments(arguments):
+    return generate_inventory(
+        sessions=arguments.sessions,
+        rds_hosts=arguments.rds_hosts,
+        farms=arguments.farms,
+        desktop_pools=arguments.desktop_pools,
+        application_pools=arguments.application_pools,
+        vdi_ratio=arguments.vdi_ratio,
+    )
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Mock Horizon connection server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    add_inventory_arguments(parser)
+    arguments = parser.parse_args(argv)
+
+    server = start_server(inventory_from_arguments(arguments), arguments.host, arguments.port, arguments.latency_ms / 1000,
+                          arguments.gzip, arguments.etags)
+    print(f"Mock Horizon listening on https://{arguments.host}:{server.server_port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
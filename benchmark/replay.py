@@ -0,0 +1,125 @@
+"""
+Replays a traffic archive recorded by a collection with the Record Traffic
+parameter on (collect_traffic.jsonl.gz next to adapter.log) against
+adapter.collect(), without network. Every pod client answers from its own
+recording, with the recorded response times or at full speed, so the
+collectors can be profiled on the inventory shapes and sizes of a real site.
+
+    python benchmark/replay.py collect_traffic.jsonl.gz --speed 0 --profiling cpu
+
+The recorded instance parameters are used, --parameter overrides them. Requests
+that were not recorded, e.g. lookups a warm cache skipped when recording, are
+answered 404 and listed in the report. Each replay starts from an empty working
+directory.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmark import load_adapter
+
+def replay_instance(AdapterInstance, identifiers):
+    now = int(time.time() * 1000)
+    return AdapterInstance({
+        "adapter_key": {
+            "name": "replay",
+            "adapter_kind": "ManagementPackforOmnissaMultiPods",
+            "object_kind": "ManagementPackforOmnissaMultiPods_adapter_instance",
+            "identifiers": [
+                {"key": key, "value": value, "is_part_of_uniqueness": key in ("host", "port")}
+                for key, value in identifiers.items()
+            ],
+        },
+        "credential_config": {
+            "credential_key": "vdi_user",
+            "credential_fields": [
+                {"key": "user", "value": "replay", "is_password": False},
+                {"key": "password", "value": "replay", "is_password": True},
+                {"key": "domain", "value": "replay", "is_password": False},
+            ],
+        },
+        "collection_number": 0,
+        "collection_window": {"start_time": now - 300000, "end_time": now},
+    })
+
+def run_cycle(adapter, trafficArchive, instance, pods, speed):
+    clients = adapter.get_pod_clients(instance)
+    transports = {}
+    for client in clients.values():
+        transports[client.base_url] = trafficArchive.ReplayTransport(pods.get(client.base_url, []), speed)
+        client.session.mount("https://", transports[client.base_url])
+        client.session.mount("http://", transports[client.base_url])
+        # Recorded tokens are redacted, the replay answers whatever token is sent
+        client.set_token("replay")
+    start = time.perf_counter()
+    result = adapter.collect(instance, clients)
+    wall_time = time.perf_counter() - start
+    for client in clients.values():
+        client.close()
+    output = result.get_json()
+    objects = Counter(obj["key"]["objectKind"] for obj in output.get("result", []))
+    return {
+        "wall_time": wall_time,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "objects": sum(objects.values()),
+        "missing": Counter(path.split("?")[0] for transport in transports.values() for _, path in transport.missing),
+        "error": output.get("errorMessage"),
+    }
+
+def report(cycles, requests_recorded):
+    print(f"Recorded requests {requests_recorded}")
+    for number, cycle in enumerate(cycles, 1):
+        print(f"Cycle {number}")
+        print(f"  wall time      {cycle['wall_time']:.3f} s")
+        print(f"  peak RSS       {cycle['peak_rss_mb']} MB")
+        print(f"  objects        {cycle['objects']}")
+        if cycle["error"]:
+            print(f"  error          {cycle['error']}")
+        if cycle["missing"]:
+            print(f"  not recorded   {sum(cycle['missing'].values())}")
+            for endpoint, count in sorted(cycle["missing"].items()):
+                print(f"    {count:>7}  {endpoint}")
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Replay a recorded collection against adapter.collect()")
+    parser.add_argument("archive", help="Traffic archive written by a collection with Record Traffic on")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 replays the recorded response times, 2 twice as fast, 0 answers at once")
+    parser.add_argument("--cycles", type=int, default=1)
+    parser.add_argument("--profiling", default="off", help="Profiling mode, the reports are written to the current directory")
+    parser.add_argument("--parameter", action="append", default=[], metavar="KEY=VALUE",
+                        help="Adapter instance parameter overriding the recorded one")
+    arguments = parser.parse_args(argv)
+
+    archive = os.path.abspath(arguments.archive)
+    cwd = os.getcwd()
+    workdir = tempfile.TemporaryDirectory(prefix="replay")
+    try:
+        os.chdir(workdir.name)
+        adapter, AdapterInstance = load_adapter()
+        import trafficArchive
+        from profiler import Profiler
+
+        header, pods = trafficArchive.load(archive)
+        identifiers = dict(header["identifiers"])
+        identifiers.update(parameter.split("=", 1) for parameter in arguments.parameter)
+        identifiers["record_traffic"] = "false"
+        identifiers["daemon_mode"] = "false"
+        identifiers["profiling"] = "off"
+        instance = replay_instance(AdapterInstance, identifiers)
+        cycles = []
+        for _ in range(arguments.cycles):
+            with Profiler(arguments.profiling, "replay", directory=cwd):
+                cycles.append(run_cycle(adapter, trafficArchive, instance, pods, arguments.speed))
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+
+    report(cycles, sum(len(entries) for entries in pods.values()))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
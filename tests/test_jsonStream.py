@@ -0,0 +1,68 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+from jsonStream import iter_array
+
+BODIES = [
+    "[]",
+    " [ ] ",
+    '[1, -2.5e3, 1234567890123, 0.000001, 3E-7]',
+    '[{"id": "a", "name": "Zoë Łukasz 日本語 🎉"}, {"id": "b", "nested": [1, [2, {"c": null}]]}]',
+    '[true, false, null, "a,b]", "\\u00e9\\"\\\\", {"k": "]["}]',
+    '\n[\n  "ünïcödé",\n  12345678901234567890\n]\n',
+]
+
+MALFORMED = [
+    "[1,,2]",
+    "[1,]",
+    "[,1]",
+    "[,]",
+    "[1]garbage",
+    "[1] [2]",
+    "[1 2]",
+    "[1",
+    "[1,",
+    "{}",
+    "",
+]
+
+def split(data, random):
+    # Cuts the body at random byte offsets, inside multi-byte characters and numbers too
+    cuts = sorted(random.sample(range(1, len(data)), min(len(data) - 1, random.randint(0, 8)))) if len(data) > 1 else []
+    return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+@pytest.mark.parametrize("body", BODIES)
+def test_random_chunks(body):
+    data = body.encode("utf-8")
+    generator = random.Random(body)
+    for _ in range(200):
+        assert list(iter_array(split(data, generator))) == json.loads(body)
+
+def test_every_single_cut():
+    body = BODIES[3] + BODIES[2]
+    body = body.replace("][", ",")
+    data = body.encode("utf-8")
+    for cut in range(1, len(data)):
+        assert list(iter_array([data[:cut], data[cut:]])) == json.loads(body)
+
+def test_one_byte_chunks():
+    for body in BODIES:
+        data = body.encode("utf-8")
+        assert list(iter_array([data[i:i + 1] for i in range(len(data))])) == json.loads(body)
+
+def test_projection():
+    body = b'[{"id": 1, "name": "a", "extra": 2}, 3]'
+    assert list(iter_array([body], fields=["id", "name"])) == [{"id": 1, "name": "a"}, 3]
+
+@pytest.mark.parametrize("body", MALFORMED)
+def test_malformed(body):
+    data = body.encode("utf-8")
+    generator = random.Random(body)
+    for _ in range(20):
+        with pytest.raises(ValueError):
+            list(iter_array(split(data, generator)))